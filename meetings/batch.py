@@ -0,0 +1,205 @@
+"""
+Work out the free times of lots of meetings at once, outside of the app,
+e.g. for reporting, or to redo every meeting's results after a change to
+the free time engine. Run from the "meetings" directory:
+
+    python batch.py
+        Every meeting in the database (configured the same way as the
+        app), with each one's free times saved back to it.
+    python batch.py --dump meetings.json --out free.ndjson
+        Meetings from a dump (a JSON array, or one meeting per line,
+        in Mongo's extended JSON), with free times written to a file.
+
+Meetings are streamed through a process pool a batch at a time, so it
+uses every core but never holds more than a few batches in memory.
+Results are saved in bulk, a batch per round trip, and only if the
+meeting hasn't changed since it was read.
+"""
+# Author: Sam Champer
+
+import argparse
+from itertools import islice
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from bson import json_util
+from pymongo import MongoClient, UpdateOne
+
+import config
+from epoch_free import index_free
+import meeting_store
+
+log = logging.getLogger(__name__)
+
+# The fields of a meeting that working out its free times needs.
+FIELDS = ["code", "daterange", "duration", "version", "busy",
+          "log_count", "merged", "pending"]
+
+
+def meeting_free(record):
+    """
+    Work out the free times of one meeting record.
+    Runs in the worker processes, so everything it needs is in the record.
+    :return: a dict of the meeting code, version and free times (as
+             [iso_start, iso_end] pairs), or None for meetings that
+             haven't been set up yet.
+    """
+    if record.get("daterange", "None") == "None":
+        return None
+    index = meeting_store.record_index(record)
+    free = index_free(index, meeting_store.day_range(record), record["duration"])
+    return {"code": record["code"],
+            "version": record.get("version", 0),
+            "free": [[i[0].isoformat(), i[1].isoformat()] for i in free]}
+
+
+def run(records, write, workers=None, batch_size=500, report_every=10):
+    """
+    Work out free times for a stream of meeting records in a process pool.
+    :param records: an iterable of meeting records, read lazily.
+    :param write: called with each batch of results; returns how many
+                  of them it saved.
+    :param workers: number of processes; one per core by default.
+    :param report_every: seconds between progress reports.
+    :return: (meetings saved, meetings skipped, seconds taken). Meetings
+             that changed after they were read count as neither.
+    """
+    records = iter(records)
+    done = skipped = worked_out = 0
+    begin = last_report = time.monotonic()
+    with multiprocessing.Pool(workers) as pool:
+        chunksize = max(batch_size // (4 * (workers or os.cpu_count() or 1)), 1)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            results = [i for i in pool.imap_unordered(meeting_free, batch, chunksize)
+                       if i is not None]
+            skipped += len(batch) - len(results)
+            if results:
+                done += write(results)
+            worked_out += len(results)
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                log.info("{} meetings, {:.1f} meetings/s".format(done, done / (now - begin)))
+                last_report = now
+    if worked_out > done:
+        log.info("{} meetings changed after they were read, left alone".format(worked_out - done))
+    return done, skipped, time.monotonic() - begin
+
+
+def mongo_records(collection, batch_size=500):
+    """
+    Stream every meeting from the database.
+    """
+    projection = dict.fromkeys(FIELDS, 1)
+    projection["_id"] = 0
+    return collection.find({"type": "meeting"}, projection, batch_size=batch_size)
+
+
+def dump_records(path):
+    """
+    Stream meetings from a dump file: one JSON document per line, or a
+    JSON array (which has to be read all at once).
+    """
+    with open(path) as dump:
+        first = dump.read(1)
+        while first.isspace():
+            first = dump.read(1)
+        if first == "[":
+            yield from json_util.loads(first + dump.read())
+            return
+        line = first + dump.readline()
+        while line:
+            if line.strip():
+                yield json_util.loads(line)
+            line = dump.readline()
+
+
+def mongo_writer(collection):
+    """
+    Save free times to the meetings in bulk, one round trip a batch.
+    A meeting that has changed since it was read is left alone.
+    :return: a function that saves a batch of results, returning how
+             many meetings it saved.
+    """
+    def write(results):
+        done = collection.bulk_write(
+            [UpdateOne({"code": i["code"], "version": same_version(i["version"])},
+                       {'$set': {"free_times": i["free"], "free_version": i["version"]}})
+             for i in results], ordered=False)
+        return done.matched_count
+    return write
+
+
+def same_version(version):
+    """
+    What to match a meeting's version against, to check it hasn't changed.
+    A meeting from before versions has none, and its results say version
+    0, which has to match the missing field too.
+    """
+    if version == 0:
+        return {"$in": [0, None]}
+    return version
+
+
+def ndjson_writer(out):
+    """
+    Write free times to a file, one meeting per line.
+    """
+    def write(results):
+        out.write("".join(json_util.dumps(i) + "\n" for i in results))
+        return len(results)
+    return write
+
+
+def connect():
+    """
+    The meetings collection, configured the same way as the app.
+    """
+    CONFIG = config.configuration(proxied=True)
+    url = "mongodb://{}:{}@{}:{}/{}".format(
+        CONFIG.DB_USER, CONFIG.DB_USER_PW, CONFIG.DB_HOST, CONFIG.DB_PORT, CONFIG.DB)
+    return getattr(MongoClient(url), str(CONFIG.DB)).meetings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Work out free times for many meetings")
+    parser.add_argument("--dump", help="Read meetings from this dump file, not the database")
+    parser.add_argument("--out", help="Write free times to this file (- for stdout), "
+                                      "rather than saving them to the database")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--batch", type=int, default=500, help="Meetings per batch")
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+
+    collection = None
+    if args.dump:
+        records = dump_records(args.dump)
+    else:
+        collection = connect()
+        records = mongo_records(collection, args.batch)
+
+    out = None
+    if args.out == "-" or (args.dump and not args.out):
+        write = ndjson_writer(sys.stdout)
+    elif args.out:
+        out = open(args.out, "w")
+        write = ndjson_writer(out)
+    else:
+        write = mongo_writer(collection)
+
+    try:
+        done, skipped, seconds = run(records, write, args.workers, args.batch)
+    finally:
+        if out is not None:
+            out.close()
+    log.info("Done: {} meetings saved in {:.1f}s, {:.1f} meetings/s ({} not set up yet, skipped)".format(
+        done, seconds, done / seconds if seconds else 0, skipped))
+
+
+if __name__ == "__main__":
+    main()
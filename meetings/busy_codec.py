@@ -0,0 +1,47 @@
+# Compact binary format for storing busy times in the database.
+# Author: Sam Champer
+#
+# A list of [start, end] epoch second pairs is stored as one binary
+# value of little endian int64s: start, end, start, end, ...
+# That's 16 bytes an interval, rather than ~100 bytes for a pair of iso
+# format strings, and decoding is a single copy with no parsing.
+
+from array import array
+import sys
+
+from bson.binary import Binary
+
+# array('q') is a native int64, so fix the byte order when it matters.
+_SWAP = sys.byteorder != "little"
+
+
+def pack(pairs):
+    """
+    Pack [start, end] epoch second pairs into a Binary for Mongo.
+    """
+    flat = array('q')
+    for start, end in pairs:
+        flat.append(start)
+        flat.append(end)
+    if _SWAP:
+        flat.byteswap()
+    return Binary(flat.tobytes())
+
+
+def unpack_flat(blob):
+    """
+    Unpack a blob into a flat array of int64s: start, end, start, end, ...
+    """
+    flat = array('q')
+    flat.frombytes(bytes(blob))
+    if _SWAP:
+        flat.byteswap()
+    return flat
+
+
+def unpack(blob):
+    """
+    Unpack a blob into a list of [start, end] epoch second pairs.
+    """
+    flat = unpack_flat(blob)
+    return list(map(list, zip(flat[0::2], flat[1::2])))
@@ -0,0 +1,55 @@
+# Functions to keep an always merged, sorted index of busy times
+# for a meeting, so that the free time calculation doesn't have to
+# sort and merge everyone's busy times on every page load.
+# Author: Sam Champer
+
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+from epoch_free import parse_interval, merge_intervals
+
+# The index is a list of [start, end] pairs of integer epoch seconds.
+# Pairs are sorted and never overlap or touch, so both the starts
+# and the ends are in sorted order and can be bisected.
+_START = itemgetter(0)
+_END = itemgetter(1)
+
+
+def build(busy):
+    """
+    Build an index from scratch out of a list of iso format busy times,
+    e.g. the "busy" array of a meeting that predates the index.
+    :param busy: a list of [iso_start, iso_end] pairs.
+    :return: a merged index.
+    """
+    intervals = [parse_interval(i[0], i[1]) for i in busy]
+    intervals.sort(key=_START)
+    return [[i[0], i[1]] for i in merge_intervals(intervals)]
+
+
+def insert(index, busy):
+    """
+    Splice new busy times into an index in place. Each new interval
+    costs two bisections, so adding k intervals to an index of n costs
+    O(k log n) comparisons rather than a sort of everything.
+    :param index: a merged index, which gets updated.
+    :param busy: a list of [iso_start, iso_end] pairs.
+    :return: the index.
+    """
+    for i in busy:
+        start, end, _, _ = parse_interval(i[0], i[1])
+        add(index, start, end)
+    return index
+
+
+def add(index, start, end):
+    """
+    Splice a single [start, end] epoch interval into an index in place.
+    """
+    # Everything from lo to hi overlaps or touches the new interval.
+    lo = bisect_left(index, start, key=_END)
+    hi = bisect_right(index, end, key=_START)
+    if lo < hi:
+        start = min(start, index[lo][0])
+        end = max(end, index[hi - 1][1])
+    index[lo:hi] = [[start, end]]
@@ -31,6 +31,46 @@ logging.basicConfig(format='%(levelname)s:%(message)s',
 log = logging.getLogger(__name__)
 HERE = os.path.dirname(__file__)
 
+# Values for settings that neither the command line
+# nor the configuration files give a value for.
+DEFAULTS = {
+    # Most Google calendars to fetch at once for one request.
+    "FETCH_WORKERS": 4,
+    # Seconds to wait for Google calendar before giving up on a request.
+    "FETCH_TIMEOUT": 20,
+    # How /_events gets busy times from Google calendar:
+    #   events: list every event, so users see what each one is.
+    #   freebusy: one freebusy query for only the busy times, which is
+    #             faster and never downloads event details.
+    "FETCH_MODE": "events",
+    # Base url of the Google calendar API. Left empty for Google itself;
+    # set for a stand in, like the one the load test uses.
+    "GCAL_ENDPOINT": "",
+    # Seconds to remember each session's list of calendars.
+    "CAL_LIST_TTL": 300,
+    # Seconds between database checks on a status page stream, to pick
+    # up changes made by other processes. Also keeps the connection alive.
+    "STATUS_POLL": 15,
+    # Seconds before a status page stream is closed. Browsers reconnect
+    # on their own, and this stops streams piling up forever. Each open
+    # stream holds a worker thread, so this needs a threaded or gevent
+    # server; with one thread per worker, set it to 0 to make each
+    # connection a single check, repeated every STATUS_POLL seconds.
+    "STATUS_STREAM_MAX": 300,
+    # Times to try connecting to Mongo before failing a request,
+    # and seconds to wait for it on each try.
+    "MONGO_RETRIES": 3,
+    "MONGO_TIMEOUT": 5,
+    # Seconds /healthz waits for Mongo to answer.
+    "HEALTH_TIMEOUT": 1,
+    # Directory to save request profiles to (see profiling.py).
+    # Profiling is off unless this is set.
+    "PROFILE_DIR": "",
+    # Share of requests to profile at random, from 0 to 1, e.g. 0.001.
+    # Requests with a profiling token are profiled either way.
+    "PROFILE_RATE": 0,
+}
+
 
 def command_line_args():
     """Returns namespace with settings from command line"""
@@ -137,6 +177,9 @@ def configuration(proxied=False):
         else:
             log.debug("Storing in cli")
             cli_vars[var_upper] = ini[var_lower]
+    for var in DEFAULTS:
+        if cli_vars.get(var) is None:
+            cli_vars[var] = DEFAULTS[var]
 
     imply_types(cli_vars)
 
@@ -0,0 +1,363 @@
+# Integer epoch engine for finding blocks of free time.
+# Gives the same results as free.free and free.db_free, but parses each
+# timestamp exactly once into integer UTC epoch seconds and does all of the
+# sorting, merging, gap finding and cropping on plain ints. Arrow objects are
+# only built for the final free windows, at the display boundary.
+# Author: Sam Champer
+
+from collections import namedtuple
+import heapq
+from datetime import datetime, timedelta, timezone
+from itertools import chain, islice
+from operator import itemgetter
+
+import arrow
+
+from metrics import free_stage
+
+# Intervals in this module are tuples of the form:
+#   (start, end, start_tz, end_tz)
+# where start and end are integer epoch seconds and the tz elements
+# remember which timezone each endpoint came from, so that converting
+# back to arrow gives the same wall clock times as the old engine.
+_START = itemgetter(0)
+_ONE_DAY = timedelta(days=1)
+
+# A calendar event, parsed once when it comes in from Google calendar.
+# Named tuples have no per instance dict, so these stay small, and the
+# parsed times get reused for filtering, sorting, free times and display.
+Event = namedtuple("Event", ["summary", "start", "end", "start_tz", "end_tz"])
+
+
+def parse_event(summary, start, end):
+    """
+    Parse a [summary, iso_start, iso_end] event into an Event.
+    """
+    return Event(summary, *parse_interval(start, end))
+
+
+def event_key(event):
+    """
+    What makes two events the same event, for dropping repeats.
+    """
+    return event.start, event.end, event.summary
+
+
+class DayRange:
+    """
+    A lazy stand in for the list from arrow.Arrow.range('day', begin, end).
+    Supports len, indexing and iteration, but never builds the whole list,
+    so a long date range costs nothing until someone walks through it.
+    """
+    def __init__(self, begin, end):
+        self.begin = begin
+        count = (end.date() - begin.date()).days
+        if begin.shift(days=count) > end:
+            count -= 1
+        self.count = max(count + 1, 0)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("day range index out of range")
+        return self.begin.shift(days=index)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.begin.shift(days=i)
+
+
+def free(e_list, op_hr, op_min, c_hr, c_min, day_range, min_len):
+    """
+    Drop in replacement for free.free.
+    :param e_list: A list of events: [summary, iso_start, iso_end].
+    :param op_hr: The earliest time of day that counts as free.
+    :param op_min: Minute for op_hr
+    :param c_hr: The time of day after which we do not count as free.
+    :param c_min: Minute for c_hr.
+    :param day_range: The range of days to find free time in: a DayRange
+                      or a list of arrow objects.
+    :param min_len: Minimum length in minutes of a free window.
+    :return: crop_free: A list of windows of free time, each a list of two arrow objects.
+             db_ready_busy: a list of busy times free of all personal info.
+    """
+    with free_stage("free", "parse"):
+        busy = [parse_interval(i[1], i[2]) for i in e_list]
+    with free_stage("free", "sort"):
+        busy.sort(key=_START)
+    return sorted_free(busy, op_hr, op_min, c_hr, c_min, day_range, min_len)
+
+
+def event_free(events, op_hr, op_min, c_hr, c_min, day_range, min_len):
+    """
+    Same as free, but for a list of Events sorted by start time,
+    so nothing gets parsed or sorted again.
+    """
+    busy = [i[1:] for i in events]
+    return sorted_free(busy, op_hr, op_min, c_hr, c_min, day_range, min_len)
+
+
+def sorted_free(busy, op_hr, op_min, c_hr, c_min, day_range, min_len):
+    """
+    The free part of free, for busy interval tuples sorted by start time.
+    """
+    # The daily closed hours come out of closed_hours already sorted,
+    # so they're folded in during the merge instead of being sorted.
+    with free_stage("free", "merge"):
+        merged = merge_intervals(heapq.merge(
+            busy, closed_hours(op_hr, op_min, c_hr, c_min, day_range), key=_START))
+    with free_stage("free", "gaps"):
+        windows = free_intervals(merged, arrow_point(day_range[0]), arrow_point(day_range[-1]))
+    with free_stage("free", "crop"):
+        crop_free = crop_intervals(windows, min_len)
+    return to_arrow_windows(crop_free), prep_for_db(merged)
+
+
+def db_free(e_list, day_range, duration):
+    """
+    Drop in replacement for free.db_free.
+    Unlike the old engine, the caller's list is left untouched,
+    and an empty busy list simply means the whole range is free.
+    :param e_list: a list where elements are lists with an iso start and end time.
+    :param day_range: Range of days in which to look for free times.
+    :param duration: Minimum length of time in which to schedule meetings.
+    :return: A list of free times, each a list of two arrow objects.
+    """
+    with free_stage("db_free", "parse"):
+        busy = [parse_interval(i[0], i[1]) for i in e_list]
+    with free_stage("db_free", "sort"):
+        busy.sort(key=_START)
+    with free_stage("db_free", "merge"):
+        merged = merge_intervals(busy)
+    with free_stage("db_free", "gaps"):
+        windows = free_intervals(merged, arrow_point(day_range[0]), arrow_point(day_range[-1]))
+    with free_stage("db_free", "crop"):
+        crop_free = crop_intervals(windows, duration)
+    return to_arrow_windows(crop_free)
+
+
+def index_free(index, day_range, duration):
+    """
+    Free times from a meeting's busy index (see busy_index), which is
+    already sorted and merged, so only the gap and crop steps are left.
+    Free windows are given in the timezone of the day range.
+    :param index: a list of merged [start, end] epoch second pairs.
+    :param day_range: Range of days in which to look for free times.
+    :param duration: Minimum length of time in which to schedule meetings.
+    :return: A list of free times, each a list of two arrow objects.
+    """
+    tz = day_range[0].tzinfo
+    merged = [(i[0], i[1], tz, tz) for i in index]
+    with free_stage("index_free", "gaps"):
+        windows = free_intervals(merged, arrow_point(day_range[0]), arrow_point(day_range[-1]))
+    with free_stage("index_free", "crop"):
+        crop_free = crop_intervals(windows, duration)
+    return to_arrow_windows(crop_free)
+
+
+# Ways that best_slots can rank meeting times. Each scores a slot,
+# (start, end, window_open, window_close, utc_offset), lower being better.
+_NOON = 12 * 60 * 60
+PREFERENCES = {
+    # Sooner is better.
+    "earliest": lambda slot: slot[0],
+    # The middle of the meeting as close to noon, local time, as possible.
+    "midday": lambda slot: abs(((slot[0] + slot[1]) // 2 + slot[4]) % 86400 - _NOON),
+    # Right up against a busy time, so the rest of the free
+    # window is left in one piece rather than split in two.
+    "fragmentation": lambda slot: min(slot[0] - slot[2], slot[3] - slot[1]),
+}
+
+
+def best_slots(index, day_range, duration, k, prefer=("earliest",), step=15):
+    """
+    The k best times to start a meeting, from a meeting's busy index.
+    Free windows and the meeting times in them are generated lazily and
+    only the best k are ever kept (in a heap), so a long date range
+    costs no more memory than a short one.
+    :param index: a list of merged [start, end] epoch second pairs.
+    :param day_range: Range of days in which to look for free times.
+    :param duration: Length of the meeting in minutes.
+    :param k: How many meeting times to find.
+    :param prefer: Names from PREFERENCES, most important first. Ties
+                   left over at the end go to the earliest time.
+    :param step: Minutes between the start times tried in each window.
+    :return: A list of up to k meeting times, best first, each a list
+             of two arrow objects.
+    """
+    tz = day_range[0].tzinfo
+    merged = ((i[0], i[1], tz, tz) for i in index)
+    windows = gaps(merged, arrow_point(day_range[0]), arrow_point(day_range[-1]))
+    slots = meeting_slots(windows, duration * 60, step * 60)
+    if prefer[0] == "earliest":
+        # Slots already come out earliest first.
+        best = islice(slots, k)
+    else:
+        scores = [PREFERENCES[i] for i in prefer]
+        best = heapq.nsmallest(k, slots, key=lambda slot: [f(slot) for f in scores] + [slot[0]])
+    return [[to_arrow(i[0], tz), to_arrow(i[1], tz)] for i in best]
+
+
+def meeting_slots(windows, length, step):
+    """
+    Generate the times a meeting could happen in some free windows, every
+    step seconds from the start of each window, plus one right at the end.
+    :param windows: an iterable of interval tuples of free time.
+    :param length: Length of the meeting in seconds.
+    :return: a generator of (start, end, window_open, window_close, utc_offset).
+    """
+    for w_open, w_close, open_tz, _ in windows:
+        last = w_close - length
+        if last < w_open:
+            continue
+        offset = int(datetime.fromtimestamp(w_open, open_tz).utcoffset().total_seconds())
+        for start in range(w_open, last + 1, step):
+            yield (start, start + length, w_open, w_close, offset)
+        if (last - w_open) % step:
+            yield (last, w_close, w_open, w_close, offset)
+
+
+def parse_point(text):
+    """
+    Parse an iso format time string into (epoch_seconds, tzinfo).
+    Strings without an offset are treated as UTC, like arrow.get does.
+    """
+    try:
+        as_dt = datetime.fromisoformat(text)
+    except ValueError:
+        # Not something the standard library understands; let arrow try.
+        as_dt = arrow.get(text).datetime
+    if as_dt.tzinfo is None:
+        as_dt = as_dt.replace(tzinfo=timezone.utc)
+    return int(as_dt.timestamp()), as_dt.tzinfo
+
+
+def parse_interval(start, end):
+    """
+    Parse a pair of iso format strings into an interval tuple.
+    """
+    s, s_tz = parse_point(start)
+    e, e_tz = parse_point(end)
+    return s, e, s_tz, e_tz
+
+
+def arrow_point(moment):
+    """
+    Convert an arrow object into (epoch_seconds, tzinfo).
+    """
+    return int(moment.timestamp()), moment.tzinfo
+
+
+def to_arrow(epoch, tzinfo):
+    """
+    Convert epoch seconds back into an arrow object in the given timezone.
+    """
+    return arrow.Arrow.fromtimestamp(epoch, tzinfo=tzinfo)
+
+
+def closed_hours(op_hr, op_min, c_hr, c_min, day_range):
+    """
+    Lazily generate the daily closed intervals (from closing time one day
+    to opening time the next) covering day_range, plus the day before it.
+    This is the same time that free.add_nights_to_busy blocks out, but the
+    intervals come out already sorted and are never stored as events.
+    :param day_range: a DayRange, or a list of arrow objects.
+    :return: a generator of interval tuples.
+    """
+    open_time = timedelta(hours=op_hr, minutes=op_min) + _ONE_DAY
+    close_time = timedelta(hours=c_hr, minutes=c_min)
+    first = day_range[0].datetime - _ONE_DAY
+    for i in range(len(day_range) + 1):
+        day = first + timedelta(days=i)
+        yield (int((day + close_time).timestamp()), int((day + open_time).timestamp()),
+               day.tzinfo, day.tzinfo)
+
+
+def merge_intervals(intervals):
+    """
+    :param intervals: an iterable of interval tuples, sorted by start time.
+    :return: a list of interval tuples with all overlapping and
+             immediately abutting intervals merged.
+    """
+    merged = []
+    intervals = iter(intervals)
+    first = next(intervals, None)
+    if first is None:
+        return merged
+    block_start, block_end, start_tz, end_tz = first
+    for start, end, s_tz, e_tz in intervals:
+        if start <= block_end:
+            if end > block_end:
+                block_end, end_tz = end, e_tz
+        else:
+            merged.append((block_start, block_end, start_tz, end_tz))
+            block_start, block_end, start_tz, end_tz = start, end, s_tz, e_tz
+    merged.append((block_start, block_end, start_tz, end_tz))
+    return merged
+
+
+def free_intervals(busy, range_open, range_close):
+    """
+    The gaps between merged busy intervals, following the same rules
+    as free.free_list for the first and last windows.
+    :param busy: a list of merged interval tuples.
+    :param range_open: (epoch, tz) for midnight of the first day.
+    :param range_close: (epoch, tz) for midnight of the last day.
+    :return: a list of interval tuples of free time.
+    """
+    return list(gaps(busy, range_open, range_close))
+
+
+def gaps(busy, range_open, range_close):
+    """
+    Lazy version of free_intervals, which takes any iterable of merged
+    interval tuples and generates the windows of free time one by one.
+    """
+    busy = iter(busy)
+    first = next(busy, None)
+    if first is None:
+        yield (range_open[0], range_close[0], range_open[1], range_close[1])
+        return
+
+    free_open, open_tz = range_open
+    if first[0] < free_open < first[1]:
+        # Start of the range is inside the first busy period.
+        free_open, open_tz = first[1], first[3]
+    elif not free_open > first[1]:
+        # Unless the first busy period is entirely before the range,
+        # it's the end of the first free window.
+        busy = chain([first], busy)
+
+    for start, end, s_tz, e_tz in busy:
+        yield (free_open, start, open_tz, s_tz)
+        free_open, open_tz = end, e_tz
+
+    if free_open < range_close[0]:
+        yield (free_open, range_close[0], open_tz, range_close[1])
+
+
+def crop_intervals(windows, min_len):
+    """
+    Drop windows shorter than min_len minutes.
+    """
+    min_secs = min_len * 60
+    return [i for i in windows if i[0] + min_secs <= i[1]]
+
+
+def to_arrow_windows(windows):
+    """
+    Convert interval tuples into [arrow_open, arrow_close] pairs for display.
+    """
+    return [[to_arrow(i[0], i[2]), to_arrow(i[1], i[3])] for i in windows]
+
+
+def prep_for_db(merged):
+    """
+    Convert merged interval tuples into iso format pairs for the database.
+    """
+    return [[datetime.fromtimestamp(i[0], i[2]).isoformat(),
+             datetime.fromtimestamp(i[1], i[3]).isoformat()] for i in merged]
@@ -8,7 +8,12 @@ import flask
 from flask import render_template
 from flask import request
 import logging
-import sys
+import time  # For how long status streams stay open
+import io
+from datetime import datetime
+from itertools import chain
+from operator import attrgetter
+from concurrent import futures  # For timeouts waiting on Google calendar
 
 # For converting strings to url format for mailto.
 from urllib import parse as url_parse
@@ -17,22 +22,43 @@ from urllib import parse as url_parse
 import arrow
 from dateutil import tz  # For interpreting local times
 
-# OAuth2  - Google library implementation for convenience
-from oauth2client import client
-import httplib2   # used in oauth2 flow
+# The OAuth2 and Google API libraries (oauth2client, httplib2 and
+# apiclient) are slow to import, and only the calendar routes need them,
+# so they're imported where they're used rather than here. The same goes
+# for pymongo, which isn't imported until the first database call.
 
-# Google API for services
-from apiclient import discovery
+# Fetching events from Google calendar
+import gcal
 
-# Mongo database
-from pymongo import MongoClient
+# Mongo database, connected to on first use
+from mongo_connection import LazyCollection
 
 # For creating random event codes
 import random
 from string import ascii_letters as letters
-
-# My functions to go from a list of events to a list of free times:
-from free import free, db_free
+# For keys that tie server side caches to a session
+import secrets
+
+# My functions to go from a list of events to a list of free times.
+# epoch_free gives the same results as free, but works on integer
+# epoch seconds rather than arrow objects, so it's much faster.
+from epoch_free import event_free, index_free, DayRange, to_arrow, best_slots, PREFERENCES
+# Reading and writing meetings in the database.
+import meeting_store
+# Cache of computed status page results.
+from result_cache import LRUCache
+# For free times that suit most, but not all, of a group:
+from quorum import quorum_free
+# For reading events from calendar files:
+import ics
+# For how busy each part of the date range is:
+import heatmap
+# Counters and timers, for /metrics:
+import metrics
+# For profiling slow requests:
+import profiling
+# For pushing meeting changes to status pages:
+from status_feed import StatusFeed
 
 ###
 # Globals
@@ -52,6 +78,16 @@ SCOPES = 'https://www.googleapis.com/auth/calendar.readonly'
 CLIENT_SECRET_FILE = CONFIG.GOOGLE_KEY_FILE
 APPLICATION_NAME = 'MeetMe class project'
 
+# Status page results, keyed on (meetcode, version), and the status
+# page's quorum and heatmap results, keyed on (meetcode, version, route,
+# argument), since every watcher asks for them again on every change.
+PULL_INFO_CACHE = LRUCache(max_size=256)
+# Each session's list of calendars, so /_events can reuse the
+# list that /_choose just fetched. Keyed on session_key().
+CAL_LIST_CACHE = LRUCache(max_size=1024, ttl=CONFIG.CAL_LIST_TTL)
+# Status pages watching for meetings to change.
+STATUS_FEED = StatusFeed()
+
 # Connect to mongo for database of meetings.
 MONGO_CLIENT_URL = "mongodb://{}:{}@{}:{}/{}".format(
     CONFIG.DB_USER,
@@ -61,18 +97,63 @@ MONGO_CLIENT_URL = "mongodb://{}:{}@{}:{}/{}".format(
     CONFIG.DB)
 
 app.logger.debug("Using Mongo URL: '{}'".format(MONGO_CLIENT_URL))
-try:
-    dbclient = MongoClient(MONGO_CLIENT_URL)
-    db = getattr(dbclient, str(CONFIG.DB))
-    collection = db.meetings
-except:
-    app.logger.debug("Failure opening database. Is Mongo running? Correct password?")
-    sys.exit(1)
+# Nothing connects until the first request that uses the database, and a
+# database that can't be reached fails that request rather than the worker.
+collection = LazyCollection(MONGO_CLIENT_URL, CONFIG.DB, retries=CONFIG.MONGO_RETRIES,
+                            timeout=CONFIG.MONGO_TIMEOUT)
 
 
 #############################
 # Pages and flask functions.
 #############################
+@app.before_request
+def start_timer():
+    flask.g.started = metrics.start_request()
+
+
+@app.after_request
+def record_timing(response):
+    """
+    Time every request, by route. For streamed responses, that's
+    the time until the stream starts.
+    """
+    started = flask.g.get("started")
+    if started is not None:
+        # The route pattern rather than the path, so that there's one
+        # timer per route rather than one per meeting code.
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.end_request(route, response.status_code, started)
+    return response
+
+
+# Off unless PROFILE_DIR is set.
+profiling.install(app, CONFIG.PROFILE_DIR, CONFIG.SECRET_KEY, CONFIG.PROFILE_RATE)
+
+
+@app.route("/healthz")
+def healthz():
+    """
+    Readiness check: 200 if the database answers, 503 if it doesn't.
+    It's one short ping, which doesn't wait on requests that are
+    connecting to the database.
+    """
+    try:
+        collection.ping(CONFIG.HEALTH_TIMEOUT)
+    except Exception as error:
+        app.logger.warning("Health check failed: {}".format(error))
+        return flask.jsonify(status="unavailable", mongo=str(error)), 503
+    return flask.jsonify(status="ok")
+
+
+@app.route("/metrics")
+def metrics_page():
+    """
+    Counters and timers, in the Prometheus text format.
+    """
+    return flask.Response(metrics.REGISTRY.render(),
+                          mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/")
 @app.route("/start")
 @app.route("/index")
@@ -86,11 +167,7 @@ def check():
     app.logger.debug("Checking meeting code")
     meet_code = request.args.get("meet_code")
 
-    records = []
-    for record in collection.find({"type": "meeting"}):
-        records.append(record['code'])
-
-    if meet_code in records:
+    if meeting_store.exists(collection, meet_code):
         return flask.jsonify(result={})
 
     result = {"error": "1"}
@@ -102,32 +179,21 @@ def new_meeting():
     # Get a new meeting code.
     # The meeting codes are random strings of 10 ascii letters.
     # It seems pretty unlikely that the same two codes will  be generated
-    # any time soon, but this function double checks just in case.
-    records = []
-    for record in collection.find({"type": "meeting"}):
-        records.append(record['code'])
-
-    meetcode = ''
-    done = False
-    while done is False:
+    # any time soon, but just in case, the unique index on code makes the
+    # insert fail for a code that's taken, and we try another one.
+    from pymongo.errors import DuplicateKeyError
+    while True:
         meetcode = ''.join(random.choice(letters) for _ in range(10))
-        if meetcode not in records:
-            done = True
 
-    app.logger.debug("Adding new meeting to database with meet code: {}"
-                     .format(meetcode))
+        # Add a new entry to the database.
+        try:
+            collection.insert_one(meeting_store.new_meeting(meetcode))
+            break
+        except DuplicateKeyError:
+            app.logger.debug("Meet code {} is taken, trying another".format(meetcode))
 
-    # Add a new entry to the database with a field for
-    # everything we ever want to put in there.
-    new = {"type": "meeting",
-           "busy": [],
-           "daterange": "None",
-           "participants": [],
-           "already_checked_in": [],
-           "duration": 0,
-           "description": "None",
-           "code": meetcode}
-    collection.insert(new)
+    app.logger.debug("Added new meeting to database with meet code: {}"
+                     .format(meetcode))
     # The only thing we need to keep in the session is the meetcode.
     flask.session['meetcode'] = meetcode
     return render_template('new_meeting.html')
@@ -155,12 +221,8 @@ def get_names():
     people.sort()
     # Add the people going to the event to the database.
     meetcode = flask.session['meetcode']
-    collection.find_one_and_update(
-        {"code": meetcode},
-        {'$set': {"participants": people,
-                  "description": desc,
-                  "duration": duration,
-                  "daterange": date_rng}})
+    meeting_store.set_details(collection, meetcode, people, desc, duration, date_rng)
+    STATUS_FEED.publish(meetcode)
 
     # Now that we have the meeting in the db,
     # send the meetcode over to js so we can get redirected.
@@ -190,7 +252,7 @@ def populate():
 
     # Get the record with this meet code.
     # Only one record will ever match each meetcode.
-    record = collection.find({"code": meetcode})[0]
+    record = meeting_store.read(collection, meetcode, "populate")
 
     duration = record['duration']
     description = record['description']
@@ -215,6 +277,7 @@ def jsonchoose():
     app.logger.debug("Returned from get_gcal_service")
 
     cal_list = list_calendars(gcal_service)
+    CAL_LIST_CACHE.put(session_key(), cal_list)
     result = {"cal_list": cal_list}
     return flask.jsonify(result=result)
 
@@ -227,14 +290,155 @@ def events():
         app.logger.debug("Redirecting to authorization.")
         return flask.redirect(flask.url_for('oauth2callback'))
 
-    gcal_service = get_gcal_service(credentials)
-    app.logger.debug("Returned from get_gcal_service")
+    # Google calendar is only ever talked to from this pool, which fetches
+    # calendars at the same time, each thread with its own service object.
+    with gcal.FetchPool(lambda: get_gcal_service(credentials),
+                        CONFIG.FETCH_WORKERS, CONFIG.FETCH_TIMEOUT) as pool:
+        try:
+            query = event_query(pool)
+            if CONFIG.FETCH_MODE == "freebusy":
+                # Only busy times, with no event details, all in one query.
+                fetched = [pool.result(pool.submit(
+                    gcal.free_busy, query["chosen_ids"], query["time_min"], query["time_max"]))]
+            else:
+                fetched = [[gcal.event_times(i) for i in cal_events] for cal_events in
+                           pool.events(query["chosen_ids"], query["time_min"], query["time_max"])]
+        except futures.TimeoutError:
+            app.logger.debug("Timed out waiting on Google calendar.")
+            return flask.jsonify(result={"error": "timeout"}), 504
+
+    kept = {}
+    for cal_events in fetched:
+        gcal.keep_events(cal_events, query["windows"], kept)
+
+    # Return final list and free time list to js for displaying.
+    result = events_result(kept, query)
+    return flask.jsonify(result=result)
 
-    cal_list = list_calendars(gcal_service)
 
+@app.route("/_events_stream")
+def events_stream():
+    """
+    Same as /_events, but streams the answer as newline delimited JSON,
+    so the page can show each calendar's events as soon as they arrive.
+    There's one line for each calendar as it's fetched:
+        {"calendar": summary, "events": [formatted events]}
+    and then a last line with the same result /_events sends:
+        {"result": {"event_list": ..., "formatted_free_times": ..., "db_ready_busy": ...}}
+    If Google calendar is too slow, the last line is {"error": "timeout"} instead.
+    """
+    app.logger.debug("Checking credentials for Google calendar access.")
+    credentials = valid_credentials()
+    if not credentials:
+        app.logger.debug("Redirecting to authorization.")
+        return flask.redirect(flask.url_for('oauth2callback'))
+
+    pool = gcal.FetchPool(lambda: get_gcal_service(credentials),
+                          CONFIG.FETCH_WORKERS, CONFIG.FETCH_TIMEOUT)
+    # The session can't change once streaming starts, so
+    # make sure it has its cache key before then.
+    session_key()
+
+    def ndjson(item):
+        return flask.json.dumps(item) + "\n"
+
+    def generate():
+        # The pool is closed once the stream is finished.
+        with pool:
+            try:
+                query = event_query(pool)
+                kept = {}
+                if CONFIG.FETCH_MODE == "freebusy":
+                    busy = pool.result(pool.submit(
+                        gcal.free_busy, query["chosen_ids"], query["time_min"], query["time_max"]))
+                    new = gcal.keep_events(busy, query["windows"], kept)
+                    yield ndjson({"calendar": "", "events": format_events(new)})
+                else:
+                    for cal_id, cal_events in pool.events_as_completed(
+                            query["chosen_ids"], query["time_min"], query["time_max"]):
+                        new = gcal.keep_events([gcal.event_times(i) for i in cal_events],
+                                               query["windows"], kept)
+                        yield ndjson({"calendar": query["names"][cal_id],
+                                      "events": format_events(new)})
+            except futures.TimeoutError:
+                app.logger.debug("Timed out waiting on Google calendar.")
+                yield ndjson({"error": "timeout"})
+                return
+            yield ndjson({"result": events_result(kept, query)})
+
+    return flask.Response(flask.stream_with_context(generate()),
+                          mimetype="application/x-ndjson")
+
+
+@app.route("/_upload_ics", methods=["POST"])
+def upload_ics():
+    """
+    Same as /_events, but with events from an uploaded iCalendar (.ics)
+    file rather than Google calendar. Takes the file as "calendar", plus
+    the "open" and "close" times, as a multipart form.
+    """
+    upload = request.files.get("calendar")
+    if upload is None:
+        return flask.jsonify(result={"error": "no calendar file"}), 400
+    query = meeting_query(request.form)
+
+    # The file is read a line at a time, never all at once.
+    lines = io.TextIOWrapper(upload.stream, encoding="utf-8", errors="replace")
+    busy = ics.busy_times(lines, datetime.fromisoformat(query["time_min"]),
+                          datetime.fromisoformat(query["time_max"]))
+    kept = {}
+    try:
+        gcal.keep_events(busy, query["windows"], kept)
+    except ValueError:
+        return flask.jsonify(result={"error": "couldn't read that calendar file"}), 400
+    return flask.jsonify(result=events_result(kept, query))
+
+
+def event_query(pool):
+    """
+    Work out what /_events and /_events_stream need to ask Google calendar
+    for, from the request and the meeting, using a gcal.FetchPool to
+    talk to Google calendar.
+    :return: a dict with the chosen calendar ids and their names, the daily
+             open hours, the range of days, and the meeting duration.
+    """
+    # Start listing calendars while we read from the database,
+    # unless /_choose has listed them for this session recently.
+    cache_key = session_key()
+    cal_list = CAL_LIST_CACHE.get(cache_key)
+    if cal_list is None:
+        cal_future = pool.submit(list_calendars)
+
+    query = meeting_query(request.args)
+
+    chosen = request.args.get("chosen")
+    app.logger.debug("The following calendars have been chosen: {}".format(chosen))
+
+    # Get ids of chosen calendars.
+    if cal_list is None:
+        cal_list = pool.result(cal_future)
+        CAL_LIST_CACHE.put(cache_key, cal_list)
+    chosen_ids = []
+    names = {}
+    for i in cal_list:
+        if i['summary'] in chosen:
+            chosen_ids.append(i['id'])
+            names[i['id']] = i['summary']
+
+    query["chosen_ids"] = chosen_ids
+    query["names"] = names
+    return query
+
+
+def meeting_query(args):
+    """
+    The part of event_query that doesn't depend on where events come
+    from: the meeting's range of days and duration, and the daily open
+    hours from args (the "open" and "close" request arguments).
+    """
     meetcode = flask.session['meetcode']
     # Get the record with this meet code.
-    record = collection.find({"code": meetcode})[0]
+    record = meeting_store.read(collection, meetcode, "events")
 
     # Get the stuff from the collection.
     duration = record['duration']
@@ -242,17 +446,14 @@ def events():
     begin_date = interpret_date(daterange_parts[0])
     end_date = interpret_date(daterange_parts[2])
 
-    chosen = request.args.get("chosen")
-    app.logger.debug("The following calendars have been chosen: {}".format(chosen))
-
     # Get the range of days we are interested in
     begin = arrow.get(begin_date)
     end = arrow.get(end_date)
-    day_range = arrow.Arrow.range('day', begin, end)
+    day_range = DayRange(begin, end)
 
     # Manipulate open and close times to get hours and minutes.
-    open_time = interpret_time(request.args.get("open"))
-    close_time = interpret_time(request.args.get("close"))
+    open_time = interpret_time(args.get("open"))
+    close_time = interpret_time(args.get("close"))
     open_time = open_time[-14:-9]
     close_time = close_time[-14:-9]
     open_hr = int(open_time[:2])
@@ -260,70 +461,34 @@ def events():
     close_hr = int(close_time[:2])
     close_min = int(close_time[-2:])
 
-    # Get ids of chosen calendars.
-    chosen_ids = []
-    for i in cal_list:
-        if i['summary'] in chosen:
-            chosen_ids.append(i['id'])
+    # Events are fetched with one query per calendar covering the whole
+    # date range, then events that are entirely outside of the daily
+    # open hours get dropped, which used to be done with a query per day.
+    return {"windows": gcal.open_windows(open_hr, open_min, close_hr, close_min, day_range),
+            "time_min": day_range[0].replace(hour=open_hr, minute=open_min).isoformat(),
+            "time_max": day_range[-1].replace(hour=close_hr, minute=close_min).isoformat(),
+            "hours": (open_hr, open_min, close_hr, close_min),
+            "day_range": day_range,
+            "duration": duration}
 
-    # Build the event list.
-    event_list = []
-    for day in day_range:
-        day_start = day.replace(hour=open_hr, minute=open_min)
-        day_end = day.replace(hour=close_hr, minute=close_min)
-        for cur_id in chosen_ids:
-            today_events = gcal_service.events().list(
-                calendarId=cur_id,
-                timeMin=day_start,
-                timeMax=day_end,
-                singleEvents=True).execute()
-            for event in today_events['items']:
-                try:
-                    # For repeating events.
-                    e_start = str(event['originalStartTime']['dateTime'])
-                except KeyError:
-                    try:
-                        # For standard events.
-                        e_start = str(event['start']['dateTime'])
-                    except KeyError:
-                        try:
-                            # For all day events.
-                            e_start = arrow.get(event['start']['date']).replace(tzinfo='local').isoformat()
-                        except KeyError:
-                            continue
-                try:
-                    e_finish = str(event['end']['dateTime'])
-                except KeyError:
-                    # For all day events
-                    e_finish = arrow.get(event['end']['date']).replace(tzinfo='local').isoformat()
-
-                # Each event has three elements: summary, start time, and finish time.
-                this_event = [str(event['summary']), e_start, e_finish]
-                # For repeated events:
-                if this_event not in event_list:
-                    event_list.append(this_event)
 
+def events_result(kept, query):
+    """
+    Sort the kept events, work out free times, and format it all for js.
+    """
     # Sort the event list.
-    event_list.sort(key=lambda el: arrow.get(el[1]))
+    event_list = sorted(kept.values(), key=attrgetter("start"))
 
     # Now pass all the necessary args to the function to calculate free time:
-    free_windows, db_ready_busy = free(event_list, open_hr, open_min, close_hr, close_min, day_range, duration)
+    open_hr, open_min, close_hr, close_min = query["hours"]
+    free_windows, db_ready_busy = event_free(event_list, open_hr, open_min, close_hr, close_min,
+                                             query["day_range"], query["duration"])
 
     # Free windows is a list of pairs of arrow objects
     # representing open and close time of a window of free time.
-
-    # Display formatting for the event list.
-    for i in range(len(event_list)):
-        event_list[i] = ["Event name: {}".format(event_list[i][0]),
-                         "Start time: {}".format(arrow.get(event_list[i][1]).format('ddd, MMM D, h:mm a')),
-                         "End time: {}".format(arrow.get(event_list[i][2]).format('ddd, MMM D, h:mm a'))]
-
-    # Display formatting for list of free times.
-    formatted_free_times = format_free_times(free_windows)
-
-    # Return final list and free time list to js for displaying.
-    result = {"event_list": event_list, "formatted_free_times": formatted_free_times, "db_ready_busy": db_ready_busy}
-    return flask.jsonify(result=result)
+    return {"event_list": format_events(event_list),
+            "formatted_free_times": format_free_times(free_windows),
+            "db_ready_busy": db_ready_busy}
 
 
 @app.route("/_send")
@@ -335,31 +500,17 @@ def send():
     busy_times = request.args.get('busy_times')
 
     meetcode = flask.session['meetcode']
-    # Get the record with this meet code.
-    record = collection.find({"code": meetcode})[0]
-
-    # First indicate the person who just responded.
-    if "{}".format(invitee) in record['participants']:
-        # The invitee should always be in the record unless
-        # users are doing something wrong, like multiple people
-        # choosing the same name at the same time.
-        # Either way, this if statement protects in that case.
-        record['participants'].remove("{}".format(invitee))
-        record['already_checked_in'].append("{}".format(invitee))
-
-    # Next append the new list of busy times to the list from the db.
-    # First the new list will need to be converted from a str to a list.
+
+    # The new list of busy times will need to be converted from a str to a list.
     busy_times = busy_times[3:-3].split("\"],[\"")
-    for i in range(len(busy_times)):
-        record['busy'].append(busy_times[i].split("\",\""))
+    new_busy = [i.split("\",\"") for i in busy_times]
 
-    # Now update the database with the new busy times,
-    # and updated info on who has checked in.
-    collection.find_one_and_update(
-        {"code": meetcode},
-        {'$set': {"participants": record['participants'],
-                  "already_checked_in": record['already_checked_in'],
-                  "busy": record['busy']}})
+    # Append the busy times and mark the invitee as having responded,
+    # all in one atomic update, so that people responding at the same
+    # time can't overwrite each other's busy times.
+    meeting_store.add_response(collection, meetcode, "{}".format(invitee), new_busy)
+    # Push the new free times to anyone watching the status page.
+    STATUS_FEED.publish(meetcode)
 
     result = {"meetcode": meetcode}
     return flask.jsonify(result=result)
@@ -404,21 +555,199 @@ def pull_info():
     Grabs all of the meeting details from the database,
     calculates free windows based on all busy times in
     the database, and sends it all over to user.
+    The meeting's version number goes up whenever the meeting changes,
+    so it doubles as an ETag: pages polling a meeting that hasn't changed
+    get a 304, and results for each version are only worked out once.
+    """
+    meetcode = flask.session['meetcode']
+    version = meeting_store.version(collection, meetcode)
+    etag = "{}-{}".format(meetcode, version)
+
+    if request.if_none_match.contains(etag):
+        response = flask.Response(status=304)
+    else:
+        response = flask.jsonify(result=cached_status(meetcode, version))
+    response.set_etag(etag)
+    # Make browsers check back with us rather than reuse a stale copy.
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/_status_stream")
+def status_stream():
+    """
+    Server sent events version of /_pull_info. Holds the connection
+    open and sends the status page a new result only when the meeting
+    changes, rather than having the page poll for it. Each event's id
+    is the meeting version, so a reconnecting browser that already
+    has the latest version isn't sent it again.
+
+    A stream holds a worker thread for as long as it's open, so this
+    needs a threaded or gevent server. With STATUS_STREAM_MAX set to 0
+    each connection is a single check instead, like /_pull_info with
+    its ETag, and the browser comes back every STATUS_POLL seconds.
+    """
+    meetcode = flask.session['meetcode']
+    last_sent = request.headers.get("Last-Event-ID")
+    # Tell the browser how soon to reconnect once this stream ends.
+    retry = 1000 if CONFIG.STATUS_STREAM_MAX else CONFIG.STATUS_POLL * 1000
+
+    def generate():
+        sent = last_sent
+        with STATUS_FEED.watch(meetcode) as watch:
+            yield "retry: {}\n\n".format(retry)
+            stop = time.monotonic() + CONFIG.STATUS_STREAM_MAX
+            while True:
+                version = meeting_store.version(collection, meetcode)
+                if str(version) != sent:
+                    data = flask.json.dumps(cached_status(meetcode, version))
+                    yield "id: {}\ndata: {}\n\n".format(version, data)
+                    sent = str(version)
+                left = stop - time.monotonic()
+                if left <= 0:
+                    return
+                # Changes made by this process wake us straight away.
+                # Otherwise check the database every so often, for
+                # changes made by other processes.
+                if not watch.wait(min(CONFIG.STATUS_POLL, left)):
+                    # A comment line, to keep the connection alive.
+                    yield ": waiting\n\n"
+
+    response = flask.Response(generate(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    # Stop proxies from holding back events until the stream ends.
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def cached_status(meetcode, version):
+    """
+    meeting_status for a meeting, worked out only once per version.
+    When a change wakes every status page watching the meeting, one of
+    them works it out and the rest wait for that.
+    """
+    return PULL_INFO_CACHE.get_or_make((meetcode, version), lambda: meeting_status(meetcode))
+
+
+@app.route("/_best_times")
+def best_times():
+    """
+    The best few times to hold the meeting, rather than every free window.
+    Takes the number of times to send, k, and a comma separated list of
+    preferences, most important first, from:
+        earliest: the soonest times.
+        midday: times closest to the middle of the day.
+        fragmentation: times that don't split up what's left of a free window.
+    """
+    meetcode = flask.session['meetcode']
+    try:
+        k = min(max(int(request.args.get("k", 5)), 1), 50)
+    except ValueError:
+        return flask.jsonify(result={"error": "k should be a number"}), 400
+    prefer = request.args.get("prefer", "earliest").split(",")
+    for i in prefer:
+        if i not in PREFERENCES:
+            return flask.jsonify(result={"error": "unknown preference: {}".format(i)}), 400
+
+    record = meeting_store.read(collection, meetcode, "events")
+    index = meeting_store.current_index(collection, meetcode)
+    best = best_slots(index, meeting_store.day_range(record), record["duration"], k, prefer)
+    # Only the chosen few times ever get formatted.
+    return flask.jsonify(result={"best_times": format_free_times(best)})
+
+
+@app.route("/_quorum_free")
+def quorum_free_times():
+    """
+    Times when at least k of the people who have responded are free,
+    for when there's no time that suits everyone. k defaults to all
+    but one of them. Worked out once per meeting version and k.
     """
     meetcode = flask.session['meetcode']
+    k = request.args.get("k")
+    try:
+        k = None if k is None else int(k)
+    except ValueError:
+        return flask.jsonify(result={"error": "k should be a number"}), 400
+    version = meeting_store.version(collection, meetcode)
+    return flask.jsonify(result=PULL_INFO_CACHE.get_or_make(
+        (meetcode, version, "quorum", k), lambda: quorum_result(meetcode, k)))
+
+
+def quorum_result(meetcode, k):
+    """
+    What /_quorum_free sends, for a k that's None or a number.
+    """
+    record = meeting_store.read(collection, meetcode, "quorum")
+    responded = len(record["already_checked_in"])
+    responses = meeting_store.responses(collection, meetcode)
+    k = min(max(responded - 1 if k is None else k, 1), len(responses))
+
+    free = quorum_free(responses, meeting_store.day_range(record), record["duration"], k)
+    return {"free": format_free_times(free),
+            "k": k,
+            "responded": responded}
+
+
+@app.route("/_heatmap")
+def heatmap_route():
+    """
+    How many busy times overlap each bucket of the meeting's date range,
+    for shading a heatmap. Buckets are "minutes" long (default 60). The
+    result is columnar, to keep it small: the start of the first bucket,
+    the bucket length, and then just a list of counts. Worked out once
+    per meeting version and bucket length.
+    """
+    meetcode = flask.session['meetcode']
+    try:
+        minutes = int(request.args.get("minutes", 60))
+    except ValueError:
+        return flask.jsonify(result={"error": "minutes should be a number"}), 400
+    minutes = max(minutes, 5)
+
+    version = meeting_store.version(collection, meetcode)
+    result = PULL_INFO_CACHE.get_or_make((meetcode, version, "heatmap", minutes),
+                                         lambda: heatmap_result(meetcode, minutes))
+    if "error" in result:
+        return flask.jsonify(result=result), 400
+    return flask.jsonify(result=result)
+
+
+def heatmap_result(meetcode, minutes):
+    """
+    What /_heatmap sends, or an error if there would be too many buckets.
+    """
+    record = meeting_store.read(collection, meetcode, "events")
+    day_range = meeting_store.day_range(record)
+    range_open = int(day_range[0].timestamp())
+    # The range runs to the end of its last day, not the start of it.
+    range_close = int(day_range[-1].shift(days=1).timestamp())
+    if heatmap.bucket_count(range_open, range_close, minutes * 60) > heatmap.MAX_BUCKETS:
+        return {"error": "too many buckets"}
+
+    responses = meeting_store.responses(collection, meetcode)
+    counts = heatmap.occupancy(chain.from_iterable(responses),
+                               range_open, range_close, minutes * 60)
+    return {"start": day_range[0].isoformat(),
+            "bucket_minutes": minutes,
+            "counts": counts,
+            "responded": len(responses)}
+
+
+def meeting_status(meetcode):
+    """
+    Work out everything the status page shows for a meeting.
+    """
     # Get the record with this meet code.
-    record = collection.find({"code": meetcode})[0]
+    record = meeting_store.read(collection, meetcode, "status")
 
     # Get the range of days from the db.
-    daterange_parts = record['daterange'].split()
-    begin_date = interpret_date(daterange_parts[0])
-    end_date = interpret_date(daterange_parts[2])
-    begin = arrow.get(begin_date)
-    end = arrow.get(end_date)
-    day_range = arrow.Arrow.range('day', begin, end)
+    day_range = meeting_store.day_range(record)
 
-    # Calc free times based on everyone's busy times:
-    free = db_free(record["busy"], day_range, record["duration"])
+    # Calc free times based on everyone's busy times, which are
+    # kept merged in the index.
+    index = meeting_store.current_index(collection, meetcode)
+    free = index_free(index, day_range, record["duration"])
 
     # Format the free times
     formatted_free_times = format_free_times(free)
@@ -447,7 +776,7 @@ def pull_info():
               "free": formatted_free_times,
               "mail_str": mail_str,
               "meetcode": meetcode}
-    return flask.jsonify(result=result)
+    return result
 
 
 ####
@@ -486,6 +815,7 @@ def valid_credentials():
     if 'credentials' not in flask.session:
         return None
 
+    from oauth2client import client
     credentials = client.OAuth2Credentials.from_json(
         flask.session['credentials'])
 
@@ -506,12 +836,25 @@ def get_gcal_service(credentials):
     Then the second call will succeed without additional authorization.
     """
     app.logger.debug("Entering get_gcal_service")
+    import httplib2
     http_auth = credentials.authorize(httplib2.Http())
-    service = discovery.build('calendar', 'v3', http=http_auth)
+    # Uses a discovery document cached for the whole process,
+    # so making a service object doesn't touch the network.
+    service = gcal.build_service(http_auth, CONFIG.GCAL_ENDPOINT)
     app.logger.debug("Returning service")
     return service
 
 
+def session_key():
+    """
+    A random key for this session, for looking up
+    things cached on the server for the session.
+    """
+    if 'cache_key' not in flask.session:
+        flask.session['cache_key'] = secrets.token_hex(16)
+    return flask.session['cache_key']
+
+
 @app.route('/oauth2callback')
 def oauth2callback():
     """
@@ -522,6 +865,7 @@ def oauth2callback():
     and so on.
     """
     app.logger.debug("Entering oauth2callback")
+    from oauth2client import client
     flow = client.flow_from_clientsecrets(
         CLIENT_SECRET_FILE,
         scope=SCOPES,
@@ -547,6 +891,9 @@ def oauth2callback():
         auth_code = flask.request.args.get('code')
         credentials = flow.step2_exchange(auth_code)
         flask.session['credentials'] = credentials.to_json()
+        # New credentials may be for another account, so
+        # don't reuse anything cached for the old ones.
+        flask.session.pop('cache_key', None)
         # Now I can build the service and execute the query,
         # but for the moment I'll just log it and go back to
         # the main screen
@@ -611,7 +958,8 @@ def list_calendars(service):
     Google Calendars web app) calendars before unselected calendars.
     """
     app.logger.debug("Entering list_calendars")
-    calendar_list = service.calendarList().list().execute()["items"]
+    with metrics.gcal_call("calendarList.list"):
+        calendar_list = service.calendarList().list().execute()["items"]
     result = []
     for cal in calendar_list:
         kind = cal["kind"]
@@ -647,6 +995,20 @@ def cal_sort_key(cal):
     return primary_key, selected_key, cal["summary"]
 
 
+def format_events(event_list):
+    """
+    Format a list of Events for display purposes.
+    """
+    formatted_events = []
+    for event in event_list:
+        start = to_arrow(event.start, event.start_tz)
+        end = to_arrow(event.end, event.end_tz)
+        formatted_events.append(["Event name: {}".format(event.summary),
+                                 "Start time: {}".format(start.format('ddd, MMM D, h:mm a')),
+                                 "End time: {}".format(end.format('ddd, MMM D, h:mm a'))])
+    return formatted_events
+
+
 def format_free_times(free_time_list):
     """
     Format a list of free times for display purposes.
@@ -0,0 +1,287 @@
+# Functions for getting events out of Google calendar.
+# Author: Sam Champer
+
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import threading
+import time
+
+import arrow
+
+from epoch_free import parse_event, event_key
+import metrics
+
+
+# Only ask Google for the parts of each event that we actually use.
+EVENT_FIELDS = "nextPageToken,items(summary,start,end,originalStartTime)"
+# The most events Google will return in one page.
+MAX_PAGE = 2500
+# The most calendars Google will look at in one freebusy query.
+MAX_FREEBUSY = 50
+
+
+# The parsed discovery document for the calendar API, shared by
+# every service object this process builds. See discovery_document.
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+
+
+def discovery_document():
+    """
+    The discovery document describing the calendar API, loaded and
+    parsed once per process. It comes from the copy bundled with the
+    Google API client, so no network is needed, and is only fetched
+    from Google if the installed client doesn't bundle one.
+
+    The Google client changes the document in place the first time each
+    part of the API is used (filling in each method's parameters), which
+    isn't safe while FetchPool threads build services from it at once.
+    So a throwaway service uses every part of it before it's shared.
+    """
+    global _discovery_doc
+    # The Google client is only imported once a calendar is needed,
+    # so that workers start faster.
+    from apiclient import discovery
+    import httplib2
+    with _discovery_lock:
+        if _discovery_doc is None:
+            try:
+                from googleapiclient.discovery_cache import get_static_doc
+                doc = get_static_doc('calendar', 'v3')
+            except ImportError:
+                doc = None
+            if doc is None:
+                uri = discovery.DISCOVERY_URI.format(api='calendar', apiVersion='v3')
+                _, doc = httplib2.Http().request(uri)
+            doc = json.loads(doc)
+            _use_resources(discovery.build_from_document(doc, http=httplib2.Http()),
+                           doc.get("resources", {}))
+            _discovery_doc = doc
+    return _discovery_doc
+
+
+def _use_resources(service, resources):
+    """
+    Make every resource (events, calendarList, ...) of a service, and
+    every resource inside those, so that the Google client makes all of
+    its changes to the discovery document.
+    """
+    from apiclient import discovery
+    for name, resource in resources.items():
+        _use_resources(getattr(service, discovery.fix_method_name(name))(),
+                       resource.get("resources", {}))
+
+
+def build_service(http, endpoint=None):
+    """
+    A calendar service object using an authorized http object.
+    Uses the cached discovery document, so this does no network I/O.
+    :param endpoint: base url of the calendar API, for talking to a
+                     stand in for Google (e.g. tests/fake_gcal.py).
+    """
+    from apiclient import discovery
+    if endpoint:
+        return discovery.build_from_document(discovery_document(), http=http,
+                                             client_options={"api_endpoint": endpoint})
+    return discovery.build_from_document(discovery_document(), http=http)
+
+
+def list_events(service, cal_id, time_min, time_max):
+    """
+    All the events in one calendar between time_min and time_max,
+    following nextPageToken until Google runs out of pages.
+    :param service: a Google calendar service object.
+    :param cal_id: id of the calendar to list.
+    :param time_min: iso format start of the range.
+    :param time_max: iso format end of the range.
+    :return: a generator of event dicts.
+    """
+    page_token = None
+    while True:
+        with metrics.gcal_call("events.list"):
+            page = service.events().list(
+                calendarId=cal_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                singleEvents=True,
+                maxResults=MAX_PAGE,
+                pageToken=page_token,
+                fields=EVENT_FIELDS).execute()
+        for event in page.get('items', []):
+            yield event
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            break
+
+
+def free_busy(service, cal_ids, time_min, time_max):
+    """
+    The busy blocks of several calendars from the freebusy endpoint,
+    which only sends start and end times rather than whole events.
+    All the calendars go in one query (or one per MAX_FREEBUSY calendars).
+    :return: a list of ["Busy", iso_start, iso_end] events, which free.free
+             can use just like events from list_events.
+    """
+    busy = []
+    for i in range(0, len(cal_ids), MAX_FREEBUSY):
+        with metrics.gcal_call("freebusy.query"):
+            result = service.freebusy().query(body={
+                "timeMin": time_min,
+                "timeMax": time_max,
+                "items": [{"id": cal_id} for cal_id in cal_ids[i:i + MAX_FREEBUSY]]}).execute()
+        # Keep the calendars in the order they were asked for.
+        for cal_id in cal_ids[i:i + MAX_FREEBUSY]:
+            for block in result['calendars'].get(cal_id, {}).get('busy', []):
+                busy.append(["Busy", block['start'], block['end']])
+    return busy
+
+
+def all_events(service, cal_id, time_min, time_max):
+    """
+    Like list_events, but as a list, for running on a FetchPool.
+    """
+    return list(list_events(service, cal_id, time_min, time_max))
+
+
+class FetchPool:
+    """
+    A bounded pool of threads for talking to Google calendar during
+    one request, so calendars are fetched at the same time rather than
+    one after another. Every thread builds its own service object, since
+    the httplib2.Http under a service object isn't thread safe.
+    Waiting on results gives up with a concurrent.futures.TimeoutError
+    at the deadline.
+    """
+    def __init__(self, make_service, max_workers, timeout):
+        """
+        :param make_service: function returning a new, authorized service object.
+        :param max_workers: most calendars to fetch at once.
+        :param timeout: seconds from now until the deadline.
+        """
+        self.make_service = make_service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.deadline = time.monotonic() + timeout
+        self.local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # Don't hold up the response waiting on anything past the deadline.
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def service(self):
+        """
+        The service object for the current thread.
+        """
+        if not hasattr(self.local, "service"):
+            self.local.service = self.make_service()
+        return self.local.service
+
+    def submit(self, func, *args):
+        """
+        Run func(service, *args) on a pool thread.
+        :return: a future for the result.
+        """
+        return self.executor.submit(lambda: func(self.service(), *args))
+
+    def result(self, future):
+        """
+        Wait for a future's result, but not past the deadline.
+        """
+        return future.result(timeout=max(self.deadline - time.monotonic(), 0))
+
+    def events(self, cal_ids, time_min, time_max):
+        """
+        Fetch the events of several calendars at once.
+        :return: a list of event lists, in the same order as cal_ids.
+        """
+        futures = [self.submit(all_events, i, time_min, time_max) for i in cal_ids]
+        return [self.result(i) for i in futures]
+
+    def events_as_completed(self, cal_ids, time_min, time_max):
+        """
+        Like events, but yields (cal_id, events) for each calendar
+        as soon as it has been fetched, in whatever order they finish.
+        """
+        futures = {self.submit(all_events, i, time_min, time_max): i for i in cal_ids}
+        timeout = max(self.deadline - time.monotonic(), 0)
+        for future in as_completed(futures, timeout=timeout):
+            yield futures[future], future.result()
+
+
+def event_times(event):
+    """
+    Pull the summary, start time and finish time out of an event dict.
+    :return: [summary, iso_start, iso_finish], or None if the
+             event doesn't have a usable start time.
+    """
+    try:
+        # For repeating events.
+        e_start = str(event['originalStartTime']['dateTime'])
+    except KeyError:
+        try:
+            # For standard events.
+            e_start = str(event['start']['dateTime'])
+        except KeyError:
+            try:
+                # For all day events.
+                e_start = arrow.get(event['start']['date']).replace(tzinfo='local').isoformat()
+            except KeyError:
+                return None
+    try:
+        e_finish = str(event['end']['dateTime'])
+    except KeyError:
+        # For all day events
+        e_finish = arrow.get(event['end']['date']).replace(tzinfo='local').isoformat()
+    return [str(event.get('summary', '')), e_start, e_finish]
+
+
+def open_windows(op_hr, op_min, c_hr, c_min, day_range):
+    """
+    The daily open windows over a range of days, as two sorted lists
+    of epoch seconds: one of opening times and one of closing times.
+    """
+    opens = []
+    closes = []
+    for day in day_range:
+        opens.append(int(day.replace(hour=op_hr, minute=op_min).timestamp()))
+        closes.append(int(day.replace(hour=c_hr, minute=c_min).timestamp()))
+    return opens, closes
+
+
+def in_windows(event, windows):
+    """
+    True if an Event (see epoch_free) overlaps any of the open windows,
+    the same test Google uses for timeMin and timeMax.
+    """
+    opens, closes = windows
+    # The first window that closes after the event starts.
+    index = bisect_right(closes, event.start)
+    return index < len(opens) and opens[index] < event.end
+
+
+def keep_events(cal_events, windows, kept):
+    """
+    Add the events from one calendar to the kept events, skipping events
+    outside of the open windows and events that have already been kept.
+    Each event is parsed just once, here, into an Event.
+    :param cal_events: a list of [summary, iso_start, iso_finish] events.
+    :param kept: a dict of the events kept so far, keyed on event_key.
+    :return: the Events that were added.
+    """
+    new = []
+    for this_event in cal_events:
+        if this_event is None:
+            continue
+        this_event = parse_event(*this_event)
+        if not in_windows(this_event, windows):
+            continue
+        # For repeated events. A dict lookup rather than
+        # searching through every event kept so far.
+        key = event_key(this_event)
+        if key not in kept:
+            kept[key] = this_event
+            new.append(this_event)
+    return new
@@ -0,0 +1,41 @@
+# How busy a meeting's date range is, bucket by bucket, for the heatmap
+# on the status page.
+# Author: Sam Champer
+#
+# Counts come from a difference array: each busy interval adds one where
+# it starts and takes one away where it ends, then a running total gives
+# the count for every bucket. That's one pass over the intervals and one
+# over the buckets, however many intervals overlap each bucket.
+
+from itertools import accumulate
+
+# Most buckets a heatmap can have, e.g. a year of hours.
+MAX_BUCKETS = 366 * 24
+
+
+def bucket_count(range_open, range_close, bucket):
+    """
+    How many buckets of bucket seconds it takes to cover a range.
+    """
+    return max(-(-(range_close - range_open) // bucket), 0)
+
+
+def occupancy(intervals, range_open, range_close, bucket):
+    """
+    How many busy intervals overlap each bucket of a range.
+    :param intervals: an iterable of [start, end] epoch second pairs.
+    :param range_open: epoch seconds at the start of the first bucket.
+    :param range_close: epoch seconds at the end of the range.
+    :param bucket: length of a bucket in seconds.
+    :return: a list of counts, one for each bucket.
+    """
+    buckets = bucket_count(range_open, range_close, bucket)
+    diff = [0] * (buckets + 1)
+    for start, end in intervals:
+        first = max((start - range_open) // bucket, 0)
+        last = min(-(-(end - range_open) // bucket), buckets)
+        if first < last:
+            diff[first] += 1
+            diff[last] -= 1
+    diff.pop()
+    return list(accumulate(diff))
@@ -0,0 +1,246 @@
+# Reading busy times out of iCalendar (.ics) files, so that people can
+# respond to a meeting from a calendar file rather than Google calendar.
+# Author: Sam Champer
+#
+# Files are read a line at a time, and each event is turned into busy
+# times as soon as its END:VEVENT line is read, except for recurring
+# events. Those are kept (just the rule, not the instances) until the end
+# of the file, since instances that have been moved or cancelled can be
+# listed anywhere in the file. Recurrences are then expanded lazily, only
+# from the start of the date range and stopping at its end.
+#
+# Busy times come out in the same form as gcal.event_times:
+#   [summary, iso_start, iso_end]
+
+from datetime import datetime, timedelta
+import re
+
+from dateutil import rrule, tz
+
+# Most instances of one recurring event to expand, in case of
+# something silly like an event every second.
+MAX_INSTANCES = 10000
+
+_DURATION = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def unfold(lines):
+    """
+    Join long lines that have been split up, as the standard says:
+    a line starting with a space or tab carries on the line before it.
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def split_line(line):
+    """
+    Split a content line into its name, parameters and value, e.g.
+    "DTSTART;TZID=America/Los_Angeles:20171121T090000" gives
+    ("DTSTART", {"TZID": "America/Los_Angeles"}, "20171121T090000").
+    """
+    head, _, value = line.partition(":")
+    parts = head.split(";")
+    params = {}
+    for part in parts[1:]:
+        key, _, val = part.partition("=")
+        params[key.upper()] = val.strip('"')
+    return parts[0].upper(), params, value
+
+
+def vevents(lines):
+    """
+    Generate each VEVENT in a calendar as a dict of its properties,
+    name -> (params, value). Properties that can be given more than
+    once (EXDATE) map to a list of them. Anything that isn't inside a
+    VEVENT (time zones, alarms inside events, ...) is skipped.
+    """
+    event = None
+    depth = 0
+    for line in unfold(lines):
+        name, params, value = split_line(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and event is None:
+                event = {"EXDATE": []}
+            elif event is not None:
+                depth += 1
+        elif name == "END":
+            if event is not None and depth:
+                depth -= 1
+            elif event is not None and value.upper() == "VEVENT":
+                yield event
+                event = None
+        elif event is not None and not depth:
+            if name == "EXDATE":
+                event["EXDATE"].append((params, value))
+            else:
+                event[name] = (params, value)
+
+
+def is_date(params, value):
+    """
+    True for a DATE value (an all day event) rather than a DATE-TIME.
+    """
+    return params.get("VALUE", "").upper() == "DATE" or len(value.strip()) == 8
+
+
+def parse_time(params, value, floating=None):
+    """
+    Parse a DATE or DATE-TIME value. Times in UTC end in Z, others may
+    have a TZID, and any without either are in the floating time zone,
+    local time unless given. Dates (for all day events) are midnight
+    local time, the same as gcal.event_times.
+    :return: a timezone aware datetime.
+    """
+    value = value.strip()
+    if is_date(params, value):
+        day = datetime.strptime(value[:8], "%Y%m%d")
+        return day.replace(tzinfo=tz.tzlocal())
+    moment = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return moment.replace(tzinfo=tz.tzutc())
+    zone = tz.gettz(params["TZID"]) if "TZID" in params else floating
+    return moment.replace(tzinfo=zone or tz.tzlocal())
+
+
+def parse_duration(value):
+    """
+    Parse a DURATION value, e.g. "PT1H30M", into a timedelta.
+    """
+    match = _DURATION.match(value.strip())
+    if match is None:
+        raise ValueError("bad duration: {}".format(value))
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    length = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                       minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -length if sign == "-" else length
+
+
+def event_span(event):
+    """
+    The start time and length of an event.
+    """
+    start = parse_time(*event["DTSTART"])
+    if "DTEND" in event:
+        length = parse_time(*event["DTEND"]) - start
+    elif "DURATION" in event:
+        length = parse_duration(event["DURATION"][1])
+    elif is_date(*event["DTSTART"]):
+        # An all day event with no end lasts the day.
+        length = timedelta(days=1)
+    else:
+        length = timedelta(0)
+    return start, length
+
+
+def is_busy(event):
+    """
+    False for events that don't take up any time: cancelled ones,
+    ones marked as free, and ones without a start.
+    """
+    if "DTSTART" not in event:
+        return False
+    if event.get("STATUS", ({}, ""))[1].upper() == "CANCELLED":
+        return False
+    return event.get("TRANSP", ({}, ""))[1].upper() != "TRANSPARENT"
+
+
+def as_busy(summary, start, length):
+    """
+    An event time in the same form as gcal.event_times.
+    """
+    return [summary, start.isoformat(), (start + length).isoformat()]
+
+
+def wall_clock(moment, zone):
+    """
+    A timezone aware time as a naive time on the clock in zone.
+    """
+    return moment.astimezone(zone).replace(tzinfo=None)
+
+
+def expand(event, range_start, range_end, skip=()):
+    """
+    Lazily generate the busy times of a recurring event that overlap
+    [range_start, range_end). Recurrences are worked out on the wall
+    clock of the event's time zone, so a 9am meeting stays at 9am
+    across daylight saving changes, as the standard says.
+    :param skip: start times of instances listed elsewhere in the file.
+    """
+    start, length = event_span(event)
+    zone = start.tzinfo
+    summary = event.get("SUMMARY", ({}, ""))[1]
+    rule_text = event["RRULE"][1]
+    # An UNTIL in UTC has to be on the same clock as everything else.
+    parts = []
+    for part in rule_text.split(";"):
+        key, _, value = part.partition("=")
+        if key.upper() == "UNTIL":
+            if value.endswith("Z"):
+                value = wall_clock(parse_time({}, value), zone).strftime("%Y%m%dT%H%M%S")
+            elif len(value) == 8:
+                # A date means the whole of that day.
+                value += "T235959"
+        parts.append("{}={}".format(key, value))
+    rule = rrule.rrulestr(";".join(parts), dtstart=start.replace(tzinfo=None))
+
+    # Instances that have been cancelled.
+    skip = set(skip)
+    for params, value in event["EXDATE"]:
+        for one in value.split(","):
+            skip.add(parse_time(params, one, zone))
+
+    first = wall_clock(range_start - length, zone)
+    last = wall_clock(range_end, zone)
+    count = 0
+    for instance in rule.xafter(first, inc=False):
+        if instance >= last or count >= MAX_INSTANCES:
+            return
+        count += 1
+        instance = instance.replace(tzinfo=zone)
+        if instance not in skip:
+            yield as_busy(summary, instance, length)
+
+
+def busy_times(lines, range_start, range_end):
+    """
+    Generate the busy times from a calendar file that overlap a range.
+    :param lines: the lines of an .ics file, e.g. an open text file.
+    :param range_start, range_end: timezone aware datetimes.
+    :return: a generator of [summary, iso_start, iso_end] lists.
+    """
+    recurring = []
+    # Instances of recurring events that are listed on their own,
+    # by the UID of the event they belong to.
+    moved = {}
+    for event in vevents(lines):
+        if "RECURRENCE-ID" in event:
+            uid = event.get("UID", ({}, ""))[1]
+            moved.setdefault(uid, set()).add(parse_time(*event["RECURRENCE-ID"]))
+        if not is_busy(event):
+            continue
+        if "RRULE" in event and "RECURRENCE-ID" not in event:
+            recurring.append(event)
+            continue
+        start, length = event_span(event)
+        if start < range_end and start + length > range_start:
+            yield as_busy(event.get("SUMMARY", ({}, ""))[1], start, length)
+
+    for event in recurring:
+        uid = event.get("UID", ({}, ""))[1]
+        try:
+            yield from expand(event, range_start, range_end, moved.get(uid, ()))
+        except ValueError:
+            # A rule we can't make sense of; leave the event out
+            # rather than refuse the whole file.
+            continue
@@ -0,0 +1,229 @@
+# Functions for reading and writing meeting records in the database.
+# Author: Sam Champer
+#
+# Every write to a meeting is a single atomic update, so responders
+# submitting at the same time can't overwrite each other.
+#
+# Busy times are stored in the compact binary format from busy_codec.
+# "busy_log" is a list with one packed entry per person who has
+# responded (just times, with nothing to say whose they are), and
+# "log_count" is its length. Only a participant's first response goes in
+# the log, so nobody counts as more than one of the people responding;
+# anything sent after that, or by someone not on the list, only goes
+# into the merged index.
+# The log is kept sorted (in the database's order for binary values, by
+# length and then byte by byte), and the names in
+# "already_checked_in" are kept sorted too, so neither order says who
+# responded when, and the two can't be lined up to tell whose busy times
+# are whose.
+#
+# The "merged" index (see busy_index), also packed, has everyone's busy
+# times put together. Saving a response doesn't touch it, since that
+# would mean reading and rewriting the whole thing: the response's busy
+# times are pushed onto "pending" instead, one {"start", "end"} document
+# per busy time, kept sorted by start, so everyone's are mixed together
+# with nothing to say which were sent together. "sent_count" counts
+# every response sent. Reading the index folds pending into it and saves
+# the result, but only if nothing has been sent since it was read.
+# "merged_count" says how many of the responses sent the saved index
+# covers.
+
+import arrow
+from dateutil import tz
+
+import busy_codec
+import busy_index
+from epoch_free import DayRange
+
+# The fields each route reads, so that no route reads busy times
+# (by far the biggest part of a meeting) unless it uses them.
+ROUTE_FIELDS = {
+    "populate": ["description", "duration", "participants"],
+    "events": ["duration", "daterange"],
+    "quorum": ["duration", "daterange", "already_checked_in"],
+    "status": ["description", "participants", "already_checked_in",
+               "duration", "daterange", "version"],
+}
+
+
+def exists(collection, meetcode):
+    """
+    True if there's a meeting with this code. An indexed
+    lookup that only brings back the _id.
+    """
+    return collection.find_one({"code": meetcode, "type": "meeting"}, {"_id": 1}) is not None
+
+
+def read(collection, meetcode, route):
+    """
+    Read the fields of a meeting that a route needs.
+    :param route: one of the keys of ROUTE_FIELDS.
+    :return: a dict of those fields, or None if there's no such meeting.
+    """
+    fields = dict.fromkeys(ROUTE_FIELDS[route], 1)
+    fields["_id"] = 0
+    return collection.find_one({"code": meetcode}, fields)
+
+
+def version(collection, meetcode):
+    """
+    The version of a meeting, which goes up every time it changes.
+    """
+    return collection.find_one({"code": meetcode}, {"_id": 0, "version": 1}).get("version", 0)
+
+
+def new_meeting(code):
+    """
+    A new meeting record, with a field for everything
+    we ever want to put in there.
+    """
+    return {"type": "meeting",
+            "busy_log": [],
+            "log_count": 0,
+            "merged": busy_codec.pack([]),
+            "merged_count": 0,
+            "sent_count": 0,
+            "pending": [],
+            "daterange": "None",
+            "participants": [],
+            "already_checked_in": [],
+            "duration": 0,
+            "description": "None",
+            "version": 0,
+            "code": code}
+
+
+def set_details(collection, meetcode, participants, description, duration, daterange):
+    """
+    Fill in the details of a meeting that the host sets up.
+    """
+    collection.find_one_and_update(
+        {"code": meetcode},
+        {'$set': {"participants": participants,
+                  "description": description,
+                  "duration": duration,
+                  "daterange": daterange},
+         '$inc': {"version": 1}})
+
+
+def migrate(collection, meetcode):
+    """
+    Convert a meeting that still stores busy times as iso format
+    strings in "busy" to the packed busy log. All of its old busy
+    times become a single log entry. Does nothing for newer meetings.
+    """
+    while True:
+        record = collection.find_one({"code": meetcode}, {"log_count": 1})
+        if "log_count" in record:
+            return
+        record = collection.find_one({"code": meetcode}, {"busy": 1})
+        if "busy" in record:
+            busy = record["busy"]
+            # Only save if the busy times haven't changed since we read them.
+            unchanged = {"$size": len(busy)}
+        else:
+            busy = []
+            unchanged = {"$exists": False}
+        merged = busy_index.build(busy)
+        collection.find_one_and_update(
+            {"code": meetcode, "log_count": {"$exists": False}, "busy": unchanged},
+            {'$set': {"busy_log": [busy_codec.pack(merged)] if busy else [],
+                      "log_count": 1 if busy else 0,
+                      "merged": busy_codec.pack(merged),
+                      "merged_count": 1 if busy else 0,
+                      "sent_count": 1 if busy else 0,
+                      "pending": []},
+             '$unset': {"busy": ""}})
+
+
+def add_response(collection, meetcode, invitee, busy):
+    """
+    Record a response in one atomic update: add the busy times to
+    pending, and, if the invitee is one of the participants, add them to
+    the log too and move the invitee to already_checked_in. Only the new
+    busy times are sent to the database, and nothing is read first.
+    :param busy: a list of [iso_start, iso_end] pairs.
+    """
+    migrate(collection, meetcode)
+    index = busy_index.build(busy)
+    update = {'$push': {"pending": {"$each": [{"start": start, "end": end}
+                                              for start, end in index],
+                                    "$sort": {"start": 1}}},
+              '$inc': {"sent_count": 1, "version": 1}}
+    moved = {'$push': dict(update['$push'],
+                           busy_log={"$each": [busy_codec.pack(index)], "$sort": 1},
+                           already_checked_in={"$each": [invitee], "$sort": 1}),
+             '$pull': {"participants": invitee},
+             '$inc': dict(update['$inc'], log_count=1)}
+    # Someone who isn't on the list (or has already responded) still
+    # gets their busy times counted in the merged index, but isn't
+    # moved, and doesn't get another entry in the log.
+    if collection.update_one({"code": meetcode, "participants": invitee}, moved).matched_count:
+        return
+    collection.update_one({"code": meetcode}, update)
+
+
+def responses(collection, meetcode):
+    """
+    Everyone's busy times, one list per response, in the sorted order
+    of the busy log, with nothing to say whose they are.
+    :return: a list of lists of [start, end] epoch second pairs.
+    """
+    migrate(collection, meetcode)
+    record = collection.find_one({"code": meetcode}, {"busy_log": 1})
+    return [busy_codec.unpack(entry) for entry in record["busy_log"]]
+
+
+def day_range(record):
+    """
+    The range of days of a meeting, from the "MM/DD/YYYY - MM/DD/YYYY"
+    daterange its host picked.
+    """
+    parts = record["daterange"].split()
+    # Dates are in local time, kept as a fixed UTC offset
+    # by going through an iso format string.
+    begin, end = [arrow.get(arrow.get(i, "MM/DD/YYYY").replace(tzinfo=tz.tzlocal()).isoformat())
+                  for i in (parts[0], parts[2])]
+    return DayRange(begin, end)
+
+
+def record_index(record):
+    """
+    The merged index of busy times from a whole meeting record, e.g.
+    one from a dump of the database, without going to the database.
+    """
+    if "log_count" not in record:
+        # From before the busy log.
+        return busy_index.build(record.get("busy", []))
+    return fold_pending(busy_codec.unpack(record["merged"]), record.get("pending", []))
+
+
+def fold_pending(index, pending):
+    """
+    Fold busy times from the pending list into an index, in place.
+    :return: the index.
+    """
+    for i in pending:
+        busy_index.add(index, i["start"], i["end"])
+    return index
+
+
+def current_index(collection, meetcode):
+    """
+    The merged index of a meeting's busy times, with any pending busy
+    times folded in. Only the saved index and pending are read.
+    :return: a list of merged [start, end] epoch second pairs.
+    """
+    migrate(collection, meetcode)
+    record = collection.find_one(
+        {"code": meetcode}, {"merged": 1, "pending": 1, "sent_count": 1})
+    index = busy_codec.unpack(record["merged"])
+    if record["pending"]:
+        fold_pending(index, record["pending"])
+        # If anything has been sent since we read, leave it for next time,
+        # rather than clearing busy times this index doesn't have.
+        collection.update_one(
+            {"code": meetcode, "sent_count": record["sent_count"]},
+            {'$set': {"merged": busy_codec.pack(index), "merged_count": record["sent_count"],
+                      "pending": []}})
+    return index
@@ -0,0 +1,183 @@
+# Counters and timers for seeing where time goes, served in the
+# Prometheus text format at /metrics.
+# Author: Sam Champer
+#
+# Everything is kept in memory in one registry per process. Recording a
+# value is a dict lookup and a few additions under a lock, so it's cheap
+# enough to leave on all the time. Timings go into histograms with fixed
+# buckets, which also keep a count and a total, so every timer is a
+# counter too.
+
+from bisect import bisect_left
+import threading
+import time
+
+# Upper bounds, in seconds, of the histogram buckets.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Everything that gets recorded: name -> (type, help).
+METRICS = {
+    "meetme_request_seconds": ("histogram", "Time taken to handle a request, by route."),
+    "meetme_responses_total": ("counter", "Responses sent, by route and status code."),
+    "meetme_gcal_call_seconds": ("histogram", "Time taken by calls to Google calendar."),
+    "meetme_gcal_errors_total": ("counter", "Calls to Google calendar that failed."),
+    "meetme_mongo_seconds": ("histogram", "Time taken by database commands."),
+    "meetme_mongo_errors_total": ("counter", "Database commands that failed."),
+    "meetme_free_stage_seconds": ("histogram", "Time taken by each stage of working out free times."),
+}
+
+
+class Registry:
+    """
+    All the counters and histograms of a process. Each is kept
+    under its name and a tuple of (label, value) pairs.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), amount=1):
+        """
+        Add to a counter.
+        """
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        """
+        Record a value (a time in seconds) in a histogram.
+        """
+        key = (name, labels)
+        index = bisect_left(BUCKETS, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # One count for each bucket, one for everything
+                # bigger, then the total of all values.
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def render(self):
+        """
+        Everything recorded so far, in the Prometheus text format.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append("{}{} {}".format(name, label_text(labels), value))
+                continue
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                total = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram):
+                    total += count
+                    lines.append("{}_bucket{} {}".format(
+                        name, label_text(labels + (("le", str(bound)),)), total))
+                lines.append("{}_sum{} {}".format(name, label_text(labels), histogram[-1]))
+                lines.append("{}_count{} {}".format(name, label_text(labels), total))
+        return "\n".join(lines) + "\n"
+
+
+def label_text(labels):
+    """
+    Labels as they're written in the text format: {a="1",b="2"}
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\")
+                                             .replace('"', '\\"').replace("\n", "\\n"))
+                          for key, value in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+class Timer:
+    """
+    Time a block of code into a histogram:
+        with metrics.Timer("meetme_free_stage_seconds", func="free", stage="sort"):
+            ...
+    If error_counter is given, it's counted when the block raises.
+    """
+    __slots__ = ("name", "labels", "error_counter", "start")
+
+    def __init__(self, name, error_counter=None, **labels):
+        self.name = name
+        self.labels = tuple(sorted(labels.items()))
+        self.error_counter = error_counter
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, trace):
+        REGISTRY.observe(self.name, self.labels, time.perf_counter() - self.start)
+        if kind is not None and self.error_counter:
+            REGISTRY.inc(self.error_counter, self.labels)
+        return False
+
+
+def gcal_call(call):
+    """
+    Time a call to Google calendar, e.g. with metrics.gcal_call("events.list"):
+    """
+    return Timer("meetme_gcal_call_seconds", "meetme_gcal_errors_total", call=call)
+
+
+def free_stage(func, stage):
+    """
+    Time one stage of working out free times.
+    """
+    return Timer("meetme_free_stage_seconds", func=func, stage=stage)
+
+
+def mongo_listener():
+    """
+    A pymongo listener that times every database command (find, update,
+    insert, ...), which is every call on a collection, as pymongo reports
+    them. Made by a function so that pymongo is only imported once
+    something connects to the database.
+    """
+    from pymongo import monitoring
+
+    class MongoListener(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            REGISTRY.observe("meetme_mongo_seconds", (("command", event.command_name),),
+                             event.duration_micros / 1e6)
+
+        def failed(self, event):
+            labels = (("command", event.command_name),)
+            REGISTRY.observe("meetme_mongo_seconds", labels, event.duration_micros / 1e6)
+            REGISTRY.inc("meetme_mongo_errors_total", labels)
+
+    return MongoListener()
+
+
+def start_request():
+    """
+    Note when a request started, for end_request.
+    """
+    return time.perf_counter()
+
+
+def end_request(route, status, started):
+    """
+    Record how long a request to a route took, and its status code.
+    """
+    labels = (("route", route),)
+    REGISTRY.observe("meetme_request_seconds", labels, time.perf_counter() - started)
+    REGISTRY.inc("meetme_responses_total", labels + (("status", str(status)),))
@@ -0,0 +1,118 @@
+# A connection to the meetings collection that isn't made until the first
+# time it's used, so workers start without waiting on (or importing) Mongo,
+# and a database that's down for a moment doesn't stop a worker starting.
+# Author: Sam Champer
+#
+# Connecting is tried a few times, waiting longer between each try. If
+# every try fails, the error goes to whoever was using the collection
+# (one failed request). For a few seconds after that, every use fails
+# straight away with the same error, including requests that were
+# waiting on the failed tries, so they don't each try (and wait) again
+# in turn. The next use after that tries again from scratch.
+
+import threading
+import time
+
+import metrics
+
+
+class LazyCollection:
+    """
+    Stands in for a pymongo collection: any attribute of the real
+    collection (find_one, update_one, ...) connects first if need be.
+    """
+    def __init__(self, url, db_name, name="meetings", retries=3, timeout=5, backoff=0.5,
+                 retry_after=5):
+        """
+        :param url: mongodb:// url to connect to.
+        :param db_name: name of the database the collection is in.
+        :param retries: how many times to try connecting before giving up.
+        :param timeout: seconds to wait for the server on each try.
+        :param backoff: seconds to wait after the first failed try,
+                        doubling after each one after that.
+        :param retry_after: seconds after every try fails before trying
+                            again; uses before then get the same error.
+        """
+        self.url = url
+        self.db_name = db_name
+        self.name = name
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.collection = None
+        # (time.monotonic() when connecting last failed, the error), or None.
+        self.failure = None
+
+    def connect(self):
+        """
+        The real collection, connecting if that hasn't been done yet.
+        """
+        collection = self.collection
+        if collection is not None:
+            return collection
+        self.raise_recent_failure()
+        # Only one thread connects; the rest wait for it.
+        with self.lock:
+            if self.collection is None:
+                # If it failed while we waited, don't go through it all again.
+                self.raise_recent_failure()
+                try:
+                    self.collection = self._connect()
+                except Exception as error:
+                    self.failure = (time.monotonic(), error)
+                    raise
+            return self.collection
+
+    def raise_recent_failure(self):
+        """
+        Raise the error connecting last failed with, if that was
+        less than retry_after seconds ago.
+        """
+        failure = self.failure
+        if failure is not None and time.monotonic() - failure[0] < self.retry_after:
+            raise failure[1]
+
+    def ping(self, timeout=1):
+        """
+        Check the database answers, trying once and waiting at most
+        timeout seconds. Doesn't wait on, or count as, connecting, so a
+        health check never queues behind requests that are retrying.
+        Raises a pymongo error if the database doesn't answer.
+        """
+        import pymongo
+        collection = self.collection
+        if collection is not None:
+            with pymongo.timeout(timeout):
+                collection.database.client.admin.command("ping")
+            return
+        client = pymongo.MongoClient(self.url, serverSelectionTimeoutMS=int(timeout * 1000))
+        try:
+            client.admin.command("ping")
+        finally:
+            client.close()
+
+    def _connect(self):
+        import pymongo
+        from pymongo.errors import PyMongoError
+        wait = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                # Every database command gets timed for /metrics.
+                client = pymongo.MongoClient(self.url,
+                                             serverSelectionTimeoutMS=int(self.timeout * 1000),
+                                             event_listeners=[metrics.mongo_listener()])
+                collection = getattr(client, str(self.db_name))[self.name]
+                # Meetings are always looked up by code, and codes must be unique.
+                # This is also the first round trip, so it checks the connection.
+                collection.create_index("code", unique=True)
+                return collection
+            except PyMongoError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(wait)
+                wait *= 2
+
+    def __getattr__(self, name):
+        return getattr(self.connect(), name)
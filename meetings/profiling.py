@@ -0,0 +1,147 @@
+# Opt in profiling of single requests, for finding out why one request
+# (say /_events or /_pull_info for one meeting) is slow in production.
+# Author: Sam Champer
+#
+# A request is profiled if it carries a signed token, in the X-Profile
+# header or the "profile" query parameter, or if it's picked at random,
+# at PROFILE_RATE. Each profile is saved to PROFILE_DIR as a .pstats file
+# named after the time, the route and the meeting code, which can be read
+# with "python -m pstats <file>" or any tool that reads pstats files.
+#
+# Nothing is hooked into the app unless PROFILE_DIR is set, so requests
+# don't pay anything for profiling being available. When it is set,
+# requests that aren't picked pay for one header lookup and, if
+# sampling, one random number.
+#
+# cProfile only sees the thread it runs in, which is the one handling the
+# request. Calendars fetched in the worker threads of gcal.FetchPool show
+# up as time spent waiting on them. Streamed responses are profiled up to
+# the start of the stream.
+#
+# To make a token, good for an hour, run from the "meetings" directory:
+#     python profiling.py
+# and add it to a request, e.g. /_pull_info?profile=<token>
+
+import argparse
+import cProfile
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import time
+
+import flask
+from flask import request
+
+log = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Profile"
+TOKEN_PARAM = "profile"
+
+
+def _signature(secret, expires):
+    return hmac.new(str(secret).encode(), "profile:{}".format(expires).encode(),
+                    hashlib.sha256).hexdigest()
+
+
+def make_token(secret, seconds=3600, now=None):
+    """
+    A token that turns on profiling for requests that carry it.
+    :param secret: the app's secret key.
+    :param seconds: how long the token is good for.
+    :return: a string of the form "<expiry time>.<signature>".
+    """
+    expires = int((now if now is not None else time.time()) + seconds)
+    return "{}.{}".format(expires, _signature(secret, expires))
+
+
+def valid_token(secret, token, now=None):
+    """
+    True for a token from make_token that hasn't run out yet.
+    """
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit():
+        return False
+    if int(expires) < (now if now is not None else time.time()):
+        return False
+    return hmac.compare_digest(signature, _signature(secret, int(expires)))
+
+
+def file_name(route, meetcode, now=None):
+    """
+    Name of the file a profile gets saved to, e.g.
+    "20171121-093000.123456_pull_info_aBcDeFgHiJ.pstats".
+    Anything but letters, digits, - and _ is left out, so the
+    name can't go anywhere outside of the profile directory.
+    """
+    now = now if now is not None else time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + ".{:06d}".format(
+        int(now % 1 * 1000000))
+    parts = [re.sub(r"[^A-Za-z0-9_-]+", "_", str(i)).strip("_") for i in (route, meetcode) if i]
+    return "{}_{}.pstats".format(stamp, "_".join(i for i in parts if i) or "request")
+
+
+def install(app, directory, secret, rate=0):
+    """
+    Hook profiling into an app. Does nothing if directory is empty.
+    :param directory: where to save profiles.
+    :param secret: the app's secret key, for checking tokens.
+    :param rate: share of requests to profile without a token, 0 to 1.
+    :return: True if profiling was hooked in.
+    """
+    if not directory:
+        return False
+    rate = float(rate or 0)
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_profile():
+        # Only requests for an actual page are worth profiling.
+        if request.url_rule is None or request.endpoint == "static":
+            return
+        token = request.headers.get(TOKEN_HEADER) or request.args.get(TOKEN_PARAM)
+        if token:
+            if not valid_token(secret, token):
+                log.info("Not profiling {}: bad or expired token".format(request.path))
+                return
+        elif not (rate and random.random() < rate):
+            return
+        profiler = cProfile.Profile()
+        flask.g.profiler = profiler
+        profiler.enable()
+
+    # Teardown, not after_request, so the profiler is turned off even
+    # when the request fails, including when debugging lets the error
+    # through to the server and skips after_request.
+    @app.teardown_request
+    def save_profile(error=None):
+        profiler = flask.g.pop("profiler", None)
+        if profiler is None:
+            return
+        profiler.disable()
+        name = file_name(request.url_rule.rule, flask.session.get("meetcode"))
+        path = os.path.join(directory, name)
+        try:
+            profiler.dump_stats(path)
+        except OSError as oserror:
+            log.warning("Couldn't save profile {}: {}".format(path, oserror))
+        else:
+            log.info("Saved profile of {} to {}".format(request.path, path))
+
+    log.info("Profiling requests to {} ({:.2%} sampled)".format(directory, rate))
+    return True
+
+
+def main(argv=None):
+    import config
+    parser = argparse.ArgumentParser(description="Make a token for profiling requests")
+    parser.add_argument("--hours", type=float, default=1, help="How long the token is good for")
+    args = parser.parse_args(argv)
+    CONFIG = config.configuration(proxied=True)
+    print(make_token(CONFIG.SECRET_KEY, args.hours * 3600))
+
+
+if __name__ == "__main__":
+    main()
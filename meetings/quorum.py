@@ -0,0 +1,131 @@
+# Quorum free times: when are at least k of the n responders free?
+# Author: Sam Champer
+#
+# Each response's busy times are turned into a bitset over a grid of
+# fixed length time slots covering the meeting's date range, one bit a
+# slot, set if the responder is busy at any point in the slot. Bitsets
+# are plain python ints, built from the anonymous entries of the busy
+# log (see meeting_store), so they're no more labeled than the log is,
+# and they're never stored anywhere.
+#
+# To count how many responders are busy in every slot at once, the
+# bitsets are added up in "bit sliced" counters: counters[j] holds bit j
+# of every slot's count, so adding a responder is a few big int
+# operations, each working through 64 slots per machine word, rather
+# than a loop over slots.
+
+from epoch_free import arrow_point, to_arrow
+
+# Length of a slot, in seconds.
+QUANTUM = 5 * 60
+# Furthest past midnight at the start of the last day that the slots go,
+# however far busy times run: the closed hours after the last day end
+# the next morning.
+MAX_OVERRUN = 2 * 24 * 60 * 60
+
+
+def to_bits(busy, range_open, slots, quantum=QUANTUM):
+    """
+    The bitset of slots that a responder is busy in.
+    :param busy: a list of [start, end] epoch second pairs.
+    :param range_open: epoch seconds at the start of slot 0.
+    :param slots: the number of slots.
+    :return: an int with bit i set if slot i is busy.
+    """
+    bits = 0
+    for start, end in busy:
+        # Any part of a slot being busy makes the whole slot busy.
+        first = max((start - range_open) // quantum, 0)
+        last = min(-(-(end - range_open) // quantum), slots)
+        if first < last:
+            bits |= ((1 << (last - first)) - 1) << first
+    return bits
+
+
+def add_bits(counters, bits):
+    """
+    Add one to the count of every slot set in bits, in place.
+    :param counters: bit sliced counters: counters[j] is bit j of every count.
+    """
+    carry = bits
+    for j in range(len(counters)):
+        if not carry:
+            return
+        counters[j], carry = counters[j] ^ carry, counters[j] & carry
+    if carry:
+        counters.append(carry)
+
+
+def at_most(counters, limit, full):
+    """
+    The slots whose count is no more than limit.
+    :param full: an int with a bit set for every slot.
+    :return: an int with bit i set if slot i's count <= limit.
+    """
+    if limit < 0:
+        return 0
+    if limit >= 1 << len(counters):
+        return full
+    # Compare every count with limit at once, from the top bit down.
+    over = 0
+    equal = full
+    for j in reversed(range(len(counters))):
+        if (limit >> j) & 1:
+            equal &= counters[j]
+        else:
+            over |= equal & counters[j]
+            equal &= ~counters[j]
+    return full & ~over
+
+
+def runs(bits):
+    """
+    Generate the runs of set bits in an int, lowest first.
+    :return: a generator of (first, last + 1) bit positions.
+    """
+    offset = 0
+    while bits:
+        # Skip to the next set bit, then measure how many follow it.
+        skip = (bits & -bits).bit_length() - 1
+        bits >>= skip
+        length = (~bits & (bits + 1)).bit_length() - 1
+        yield offset + skip, offset + skip + length
+        bits >>= length
+        offset += skip + length
+
+
+def quorum_free(responses, day_range, duration, k, quantum=QUANTUM):
+    """
+    Windows of the date range in which at least k responders are free.
+    With k equal to the number of responders, this is the usual free
+    time (to the nearest slot).
+    :param responses: a list of responses, each a list of [start, end]
+                      epoch second pairs.
+    :param day_range: Range of days in which to look for free times.
+    :param duration: Minimum length of time in minutes of a window.
+    :param k: How many responders need to be free.
+    :return: A list of free times, each a list of two arrow objects.
+    """
+    range_open, tz = arrow_point(day_range[0])
+    range_close, _ = arrow_point(day_range[-1])
+    # day_range[-1] is midnight at the start of the last day. Like the
+    # usual free times (see epoch_free.gaps), gaps between busy times past
+    # that still count, so the last day's open hours, which sit between
+    # its closed hours, aren't lost. Nothing is free after the last busy time.
+    last_end = max((i[-1][1] for i in responses if i), default=range_close)
+    range_close = min(max(range_close, last_end), range_close + MAX_OVERRUN)
+    slots = max(-(-(range_close - range_open) // quantum), 0)
+    full = (1 << slots) - 1
+
+    counters = []
+    for busy in responses:
+        add_bits(counters, to_bits(busy, range_open, slots, quantum))
+    # At least k free means no more than n - k busy.
+    free = at_most(counters, len(responses) - k, full)
+
+    windows = []
+    for first, last in runs(free):
+        if (last - first) * quantum >= duration * 60:
+            windows.append([to_arrow(range_open + first * quantum, tz),
+                            to_arrow(range_open + last * quantum, tz)])
+    return windows
@@ -0,0 +1,93 @@
+# A small in-process least recently used cache, for keeping
+# computed results around between requests.
+# Author: Sam Champer
+
+from collections import OrderedDict
+import threading
+import time
+
+# Stands in for an item that isn't cached, since None could be one.
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A dict-like cache holding at most max_size items. When it's full,
+    adding an item evicts whichever item was used least recently.
+    If ttl is given, items also expire ttl seconds after being added.
+    Safe to share between the threads of a single worker.
+    """
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # Used for expiry times; tests can swap in a fake clock.
+        self.clock = time.monotonic
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        # Key -> lock held by whoever is making that key's item.
+        self.making = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Return the item for key, marking it as recently used,
+        or default if it isn't cached.
+        """
+        with self.lock:
+            try:
+                self.items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            expires, value = self.items[key]
+            if expires is not None and expires <= self.clock():
+                del self.items[key]
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Cache value under key, evicting the oldest item if needed.
+        """
+        expires = None
+        if self.ttl is not None:
+            expires = self.clock() + self.ttl
+        with self.lock:
+            self.items[key] = (expires, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def get_or_make(self, key, make):
+        """
+        Return the item for key, making it with make() and caching it
+        if it isn't cached. Only one thread makes any one key at a time:
+        others asking for it meanwhile wait, then get that thread's item,
+        rather than all making it at once.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self.lock:
+            key_lock = self.making.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                value = self.get(key, _MISSING)
+                if value is _MISSING:
+                    value = make()
+                    self.put(key, value)
+                return value
+        finally:
+            with self.lock:
+                # Whoever is last out forgets the lock.
+                if self.making.get(key) is key_lock and not key_lock.locked():
+                    del self.making[key]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
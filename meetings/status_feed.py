@@ -0,0 +1,95 @@
+# In-process publish/subscribe for meeting changes, so that status
+# pages can be pushed new results rather than polling for them.
+# Author: Sam Champer
+#
+# Watchers of a meeting all share one condition variable and a count of
+# changes, so an idle watcher costs no more than a blocked wait: there's
+# no queue per watcher, and publishing a change is a single notify_all
+# that only wakes the watchers of that meeting.
+#
+# Only changes made in this process are published. Anything watching
+# should also check the database every so often, to catch changes
+# made by other worker processes.
+
+from contextlib import contextmanager
+import threading
+
+
+class _Meeting:
+    """
+    The shared state of everyone watching one meeting.
+    """
+    __slots__ = ("changed", "count", "watchers")
+
+    def __init__(self, lock):
+        self.changed = threading.Condition(lock)
+        self.count = 0
+        self.watchers = 0
+
+
+class Watch:
+    """
+    One watcher's view of a meeting, from StatusFeed.watch.
+    """
+    def __init__(self, feed, meeting):
+        self.feed = feed
+        self.meeting = meeting
+        self.seen = meeting.count
+
+    def wait(self, timeout=None):
+        """
+        Block until the meeting changes, or timeout seconds go by.
+        :return: True if it changed since the last wait.
+        """
+        with self.feed.lock:
+            self.meeting.changed.wait_for(lambda: self.meeting.count != self.seen, timeout)
+            changed = self.meeting.count != self.seen
+            self.seen = self.meeting.count
+            return changed
+
+
+class StatusFeed:
+    """
+    Meetings that threads are watching for changes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meetings = {}
+
+    @contextmanager
+    def watch(self, meetcode):
+        """
+        Watch a meeting for changes, for the duration of a with block.
+        """
+        with self.lock:
+            meeting = self.meetings.get(meetcode)
+            if meeting is None:
+                meeting = self.meetings[meetcode] = _Meeting(self.lock)
+            meeting.watchers += 1
+        try:
+            yield Watch(self, meeting)
+        finally:
+            with self.lock:
+                meeting.watchers -= 1
+                # Forget meetings nobody is watching any more.
+                if meeting.watchers == 0:
+                    del self.meetings[meetcode]
+
+    def publish(self, meetcode):
+        """
+        Wake everyone watching a meeting, because it has changed.
+        Costs nothing if nobody is watching.
+        """
+        with self.lock:
+            meeting = self.meetings.get(meetcode)
+            if meeting is not None:
+                meeting.count += 1
+                meeting.changed.notify_all()
+
+    def watchers(self, meetcode):
+        """
+        How many watchers a meeting has.
+        """
+        with self.lock:
+            meeting = self.meetings.get(meetcode)
+            return 0 if meeting is None else meeting.watchers
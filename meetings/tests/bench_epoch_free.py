@@ -0,0 +1,56 @@
+# Benchmark of the arrow engine (free) against the epoch engine (epoch_free).
+# Run as "python -m tests.bench_epoch_free" from the "meetings" directory.
+# Author Sam Champer
+
+import random
+import timeit
+
+import arrow
+import free
+import epoch_free
+
+
+def make_busy(count, days, seed=0):
+    """
+    Random [start, end] iso pairs spread over a number of days.
+    """
+    rng = random.Random(seed)
+    base = arrow.get("2017-11-21T00:00:00-08:00")
+    busy = []
+    for _ in range(count):
+        start = base.shift(minutes=rng.randrange(0, days * 24 * 60, 5))
+        end = start.shift(minutes=rng.randrange(5, 240, 5))
+        busy.append([start.isoformat(), end.isoformat()])
+    return busy
+
+
+def best_of(func, repeat=3):
+    """
+    Best wall clock time in seconds over a few runs.
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    print("{:>8} {:>6} {:>12} {:>12} {:>8}".format(
+        "events", "days", "free (s)", "epoch (s)", "speedup"))
+    for count, days in [(100, 7), (1000, 14), (10000, 30), (50000, 90)]:
+        busy = make_busy(count, days)
+        day_range = list(arrow.Arrow.range('day', arrow.get(busy[0][0]).floor('day'),
+                                           arrow.get(busy[0][0]).floor('day').shift(days=days)))
+        events = [["Event"] + i for i in busy]
+
+        old = best_of(lambda: free.free(events, 9, 0, 17, 0, day_range, 30))
+        new = best_of(lambda: epoch_free.free(events, 9, 0, 17, 0, day_range, 30))
+        print("{:>8} {:>6} {:>12.4f} {:>12.4f} {:>7.1f}x  free".format(
+            count, days, old, new, old / new))
+
+        # db_free inserts into the caller's lists, so give it fresh copies.
+        old = best_of(lambda: free.db_free([i[:] for i in busy], day_range, 30))
+        new = best_of(lambda: epoch_free.db_free(busy, day_range, 30))
+        print("{:>8} {:>6} {:>12.4f} {:>12.4f} {:>7.1f}x  db_free".format(
+            count, days, old, new, old / new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Benchmark of building the /_events result from big calendars full of
+# recurring events: the old way (a list scan to drop repeats, and arrow
+# parsing every event again to sort and again to display) against parsing
+# each event once into an Event and dropping repeats with a dict.
+# Run as "python -m tests.bench_event_list" from the "meetings" directory.
+# Author Sam Champer
+
+from bisect import bisect_right
+from operator import attrgetter
+import time
+
+import arrow
+
+import epoch_free
+import gcal
+
+OPEN = (8, 0, 18, 0)
+
+
+def make_recurring(calendars, series, days, shared=2):
+    """
+    The instances of a number of daily recurring events, for each of a
+    number of calendars, the way Google lists them. The first few series
+    are on every calendar (a team meeting, say) so they repeat across
+    calendars and have to be dropped.
+    :return: a list of [summary, iso_start, iso_end] lists for each calendar.
+    """
+    base = arrow.get("2017-11-21T00:00:00-08:00")
+    result = []
+    for cal in range(calendars):
+        events = []
+        for s in range(series):
+            name = "Series {}".format(s) if s < shared else "Series {}-{}".format(cal, s)
+            # Spread the series through the day, some outside the open hours.
+            start = base.shift(hours=6 + s % 14, minutes=15 * (s % 4))
+            for day in range(days):
+                begin = start.shift(days=day)
+                events.append([name, begin.isoformat(), begin.shift(minutes=45).isoformat()])
+        result.append(events)
+    return result
+
+
+def old_way(fetched, windows, day_range):
+    """
+    The event handling in /_events before events were parsed just once.
+    """
+    opens, closes = windows
+    event_list = []
+    for cal_events in fetched:
+        for this_event in cal_events:
+            start, _ = epoch_free.parse_point(this_event[1])
+            finish, _ = epoch_free.parse_point(this_event[2])
+            index = bisect_right(closes, start)
+            if not (index < len(opens) and opens[index] < finish):
+                continue
+            if this_event not in event_list:
+                event_list.append(this_event)
+    event_list.sort(key=lambda el: arrow.get(el[1]))
+    free_windows, busy = epoch_free.free(event_list, *OPEN, day_range, 30)
+    return [["Event name: {}".format(event[0]),
+             "Start time: {}".format(arrow.get(event[1]).format('ddd, MMM D, h:mm a')),
+             "End time: {}".format(arrow.get(event[2]).format('ddd, MMM D, h:mm a'))]
+            for event in event_list], busy
+
+
+def new_way(fetched, windows, day_range):
+    """
+    The event handling in /_events now.
+    """
+    kept = {}
+    for cal_events in fetched:
+        gcal.keep_events(cal_events, windows, kept)
+    event_list = sorted(kept.values(), key=attrgetter("start"))
+    free_windows, busy = epoch_free.event_free(event_list, *OPEN, day_range, 30)
+    return [["Event name: {}".format(event.summary),
+             "Start time: {}".format(epoch_free.to_arrow(event.start, event.start_tz)
+                                     .format('ddd, MMM D, h:mm a')),
+             "End time: {}".format(epoch_free.to_arrow(event.end, event.end_tz)
+                                   .format('ddd, MMM D, h:mm a'))]
+            for event in event_list], busy
+
+
+def timed(func, *args):
+    """
+    Wall clock time of one run, and what it returned.
+    """
+    begin = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - begin, result
+
+
+def main():
+    print("{:>10} {:>8} {:>10} {:>10} {:>8}".format(
+        "instances", "kept", "old (s)", "new (s)", "speedup"))
+    for calendars, series, days in [(3, 8, 90), (4, 10, 250), (4, 20, 250)]:
+        fetched = make_recurring(calendars, series, days)
+        day_range = epoch_free.DayRange(arrow.get("2017-11-21T00:00:00-08:00"),
+                                        arrow.get("2017-11-21T00:00:00-08:00").shift(days=days - 1))
+        windows = gcal.open_windows(*OPEN, day_range)
+        old, old_result = timed(old_way, fetched, windows, day_range)
+        new, new_result = timed(new_way, fetched, windows, day_range)
+        assert new_result == old_result
+        print("{:>10} {:>8} {:>10.3f} {:>10.3f} {:>7.1f}x".format(
+            sum(map(len, fetched)), len(new_result[0]), old, new, old / new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Benchmark of fetching a date range of events with one Google calendar
+# query per day per calendar (the old way) against one paginated query
+# per calendar, fetched one calendar after another and on a FetchPool,
+# using the fake calendar server.
+# Run as "python -m tests.bench_gcal_fetch" from the "meetings" directory.
+# Author Sam Champer
+
+import time
+
+import arrow
+
+import gcal
+from tests.fake_gcal import FakeCalendar, make_calendars
+
+# Pretend each round trip to Google takes this long, in seconds.
+LATENCY = 0.02
+
+
+def per_day(service, cal_ids, day_range):
+    """
+    The old way: a query for the open hours of each day in each calendar.
+    """
+    found = []
+    for day in day_range:
+        for cal_id in cal_ids:
+            page = service.events().list(
+                calendarId=cal_id,
+                timeMin=day.replace(hour=9).isoformat(),
+                timeMax=day.replace(hour=17).isoformat(),
+                singleEvents=True).execute()
+            found.extend(page['items'])
+    return found
+
+
+def per_range(service, cal_ids, day_range):
+    """
+    The new way: one query (plus extra pages) per calendar.
+    """
+    windows = gcal.open_windows(9, 0, 17, 0, day_range)
+    time_min = day_range[0].replace(hour=9).isoformat()
+    time_max = day_range[-1].replace(hour=17).isoformat()
+    found = []
+    for cal_id in cal_ids:
+        for event in gcal.list_events(service, cal_id, time_min, time_max):
+            if gcal.in_windows(gcal.event_times(event), windows):
+                found.append(event)
+    return found
+
+
+def pooled(make_service, cal_ids, day_range):
+    """
+    One query per calendar, with the calendars fetched at the same time.
+    """
+    windows = gcal.open_windows(9, 0, 17, 0, day_range)
+    time_min = day_range[0].replace(hour=9).isoformat()
+    time_max = day_range[-1].replace(hour=17).isoformat()
+    found = []
+    with gcal.FetchPool(make_service, 10, 60) as pool:
+        for cal_events in pool.events(cal_ids, time_min, time_max):
+            for event in cal_events:
+                if gcal.in_windows(gcal.event_times(event), windows):
+                    found.append(event)
+    return found
+
+
+def main():
+    print("{:>5} {:>5} {:>8} | {:>8} {:>9} | {:>8} {:>9} | {:>9}".format(
+        "cals", "days", "events", "day RTs", "day (s)", "rng RTs", "rng (s)", "pool (s)"))
+    for cals, days in [(1, 7), (5, 14), (5, 30), (10, 30)]:
+        calendars = make_calendars(cals, 6, days)
+        day_range = list(arrow.Arrow.range('day', arrow.get("2017-11-21T00:00:00-08:00"),
+                                           arrow.get("2017-11-21T00:00:00-08:00").shift(days=days - 1)))
+        with FakeCalendar(calendars, latency=LATENCY) as fake:
+            service = fake.service()
+            cal_ids = list(calendars)
+
+            begin = time.perf_counter()
+            old = per_day(service, cal_ids, day_range)
+            old_time = time.perf_counter() - begin
+            old_trips = fake.count("events")
+
+            begin = time.perf_counter()
+            new = per_range(service, cal_ids, day_range)
+            new_time = time.perf_counter() - begin
+            new_trips = fake.count("events") - old_trips
+
+            begin = time.perf_counter()
+            pool = pooled(fake.service, cal_ids, day_range)
+            pool_time = time.perf_counter() - begin
+
+        print("{:>5} {:>5} {:>8} | {:>8} {:>9.3f} | {:>8} {:>9.3f} | {:>9.3f}".format(
+            cals, days, len(new), old_trips, old_time, new_trips, new_time, pool_time))
+        assert len(old) == len(new) == len(pool)
+
+
+if __name__ == "__main__":
+    main()
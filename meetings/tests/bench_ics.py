@@ -0,0 +1,59 @@
+# Benchmark of reading busy times out of big calendar files, which
+# also makes for a local, repeatable source of large calendars.
+# Run as "python -m tests.bench_ics" from the "meetings" directory.
+# Author Sam Champer
+
+from datetime import datetime
+import time
+
+import arrow
+from dateutil import tz
+
+from epoch_free import DayRange
+import gcal
+import ics
+
+
+def make_calendar(series, singles):
+    """
+    The lines of a calendar file with a number of recurring events,
+    each going on for years, and a number of one off events.
+    """
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0"]
+    for s in range(series):
+        lines += ["BEGIN:VEVENT", "UID:series{}".format(s),
+                  "SUMMARY:Series {}".format(s),
+                  "DTSTART;TZID=America/Los_Angeles:2015{:02d}{:02d}T{:02d}{:02d}00".format(
+                      1 + s % 12, 1 + s % 28, 6 + s % 12, 15 * (s % 4)),
+                  "DURATION:PT45M",
+                  "RRULE:FREQ={}".format(["DAILY", "WEEKLY", "DAILY;INTERVAL=2"][s % 3]),
+                  "END:VEVENT"]
+    for e in range(singles):
+        lines += ["BEGIN:VEVENT", "UID:single{}".format(e), "SUMMARY:Single {}".format(e),
+                  "DTSTART:2017{:02d}{:02d}T{:02d}0000Z".format(1 + e % 12, 1 + e % 28, e % 24),
+                  "DTEND:2017{:02d}{:02d}T{:02d}3000Z".format(1 + e % 12, 1 + e % 28, e % 24),
+                  "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    return [i + "\r\n" for i in lines]
+
+
+def main():
+    zone = tz.gettz("America/Los_Angeles")
+    print("{:>7} {:>8} {:>6} {:>10} {:>10} {:>12}".format(
+        "series", "singles", "days", "instances", "kept", "seconds"))
+    for series, singles, days in [(20, 1000, 30), (50, 5000, 90), (100, 20000, 365)]:
+        lines = make_calendar(series, singles)
+        begin = arrow.get(datetime(2017, 1, 1, tzinfo=zone))
+        day_range = DayRange(begin, begin.shift(days=days - 1))
+        windows = gcal.open_windows(8, 0, 18, 0, day_range)
+        start = time.perf_counter()
+        busy = list(ics.busy_times(lines, day_range[0].datetime, day_range[-1].shift(days=1).datetime))
+        kept = {}
+        gcal.keep_events(busy, windows, kept)
+        seconds = time.perf_counter() - start
+        print("{:>7} {:>8} {:>6} {:>10} {:>10} {:>12.3f}".format(
+            series, singles, days, len(busy), len(kept), seconds))
+
+
+if __name__ == "__main__":
+    main()
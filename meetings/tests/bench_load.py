@@ -0,0 +1,236 @@
+# Load test of the whole app: many meetings, each with many people
+# responding, driven over HTTP against the app running in a real server.
+# Run as "python -m tests.bench_load" from the "meetings" directory,
+# with --help for the options.
+# Author Sam Champer
+#
+# Nothing outside of this process is needed:
+#   Google calendar is the fake server from tests/fake_gcal.py, with a
+#     configurable number of calendars, events and latency.
+#   Mongo is mongomock, handed to the app's collection as if it had
+#     already connected, so it never connects to anything.
+#   OAuth is skipped by starting each browser with a session that already
+#     holds credentials, which the app takes as valid. The fake calendar
+#     server doesn't check them.
+#   Configuration comes from a throwaway credentials.ini.
+#
+# Each simulated meeting goes through the same requests the pages make:
+#   organizer: /new_meeting, /_get_names
+#   each responder: /<meetcode>/join, /_choose, /_events, /_send, /_pull_info
+# Meetings run on a pool of simulated users, and requests per second and
+# the 50th and 99th percentile latency are reported for each route.
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib import error as url_error
+from urllib import parse as url_parse
+from urllib import request as url_request
+
+import mongomock
+from oauth2client import client
+from werkzeug.serving import make_server
+
+from tests.fake_gcal import FakeCalendar, make_calendars
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CREDENTIALS_INI = """[DEFAULT]
+DEBUG = False
+SECRET_KEY = {}
+GOOGLE_KEY_FILE = client_secret.json
+DB_USER = load
+DB_USER_PW = test
+DB_HOST = localhost
+DB_PORT = 27017
+DB = meetings
+"""
+
+
+def load_app(fake_url):
+    """
+    Import the app with Mongo swapped for mongomock, configured
+    from a throwaway credentials.ini, talking to the fake calendar.
+    """
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    here = os.getcwd()
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, "credentials.ini"), "w") as ini:
+            ini.write(CREDENTIALS_INI.format(os.urandom(16).hex()))
+        os.chdir(config_dir)
+        try:
+            import flask_main
+        finally:
+            os.chdir(here)
+    flask_main.collection.collection = mongomock.MongoClient().db.meetings
+    flask_main.collection.create_index("code", unique=True)
+    flask_main.CONFIG.GCAL_ENDPOINT = fake_url
+    flask_main.app.logger.setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    return flask_main
+
+
+def fake_credentials():
+    """
+    OAuth credentials, as kept in the session, that don't run out for
+    a day, as if the user had already been through /oauth2callback.
+    """
+    return client.OAuth2Credentials(
+        access_token="load-test", client_id="load-test", client_secret="load-test",
+        refresh_token=None, token_expiry=datetime.utcnow() + timedelta(days=1),
+        token_uri="http://127.0.0.1/token", user_agent=None).to_json()
+
+
+def session_cookie(app):
+    """
+    A session cookie holding fake_credentials.
+    """
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({"credentials": fake_credentials()})
+
+
+class Browser:
+    """
+    One person's browser: keeps the session cookie between requests,
+    and times every request into timings.
+    """
+    def __init__(self, base, cookie, timings):
+        self.base = base
+        self.cookie = cookie
+        self.timings = timings
+
+    def get(self, route, path, **params):
+        """
+        Make a request and time it under route.
+        :return: the JSON answer, or None for other pages.
+        """
+        url = self.base + path
+        if params:
+            url += "?" + url_parse.urlencode(params)
+        req = url_request.Request(url, headers={"Cookie": "session=" + self.cookie})
+        start = time.perf_counter()
+        try:
+            with url_request.urlopen(req) as response:
+                body = response.read()
+                status = response.status
+                cookies = response.headers.get_all("Set-Cookie") or []
+                kind = response.headers.get_content_type()
+        except url_error.HTTPError as failed:
+            self.timings.add(route, time.perf_counter() - start, failed.code)
+            return None
+        self.timings.add(route, time.perf_counter() - start, status)
+        for header in cookies:
+            cookie = SimpleCookie(header)
+            if "session" in cookie:
+                self.cookie = cookie["session"].value
+        return json.loads(body) if kind == "application/json" else None
+
+
+class Timings:
+    """
+    Latency of every request, by route, and failures.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = {}
+        self.failed = {}
+
+    def add(self, route, seconds, status):
+        with self.lock:
+            self.seconds.setdefault(route, []).append(seconds)
+            if status >= 400:
+                self.failed[route] = self.failed.get(route, 0) + 1
+
+
+def percentile(values, share):
+    """
+    Nearest rank percentile of a sorted list.
+    """
+    return values[min(int(share * len(values)), len(values) - 1)]
+
+
+def run_meeting(base, cookie, timings, responders, calendars):
+    """
+    One meeting, from being set up to everyone having responded.
+    """
+    organizer = Browser(base, cookie, timings)
+    organizer.get("/new_meeting", "/new_meeting")
+    names = ["person{}".format(i) for i in range(responders)]
+    answer = organizer.get("/_get_names", "/_get_names",
+                           participants=json.dumps(names, separators=(",", ":")),
+                           desc="Load test", duration="60",
+                           daterange="11/21/2017 - 11/27/2017")
+    meetcode = answer["result"]["meetcode"]
+
+    for i, name in enumerate(names):
+        person = Browser(base, cookie, timings)
+        person.get("/<meetcode>/join", "/{}/join".format(meetcode))
+        person.get("/_choose", "/_choose")
+        # Everyone picks a different couple of calendars.
+        chosen = [calendars[(i + j) % len(calendars)] for j in range(min(2, len(calendars)))]
+        answer = person.get("/_events", "/_events", open="9:00am", close="5:00pm",
+                            chosen=json.dumps(chosen))
+        busy = answer["result"]["db_ready_busy"] if answer else []
+        person.get("/_send", "/_send", invitee=name,
+                   busy_times=json.dumps(busy, separators=(",", ":")))
+        person.get("/_pull_info", "/_pull_info")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app")
+    parser.add_argument("--meetings", type=int, default=40, help="Meetings to simulate")
+    parser.add_argument("--responders", type=int, default=4, help="People responding to each meeting")
+    parser.add_argument("--users", type=int, default=8, help="Meetings going on at once")
+    parser.add_argument("--calendars", type=int, default=3, help="Calendars each person has")
+    parser.add_argument("--events", type=int, default=6, help="Events a day in each calendar")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds each call to the fake Google calendar takes")
+    args = parser.parse_args(argv)
+
+    fake = FakeCalendar(make_calendars(args.calendars, args.events, 7), latency=args.latency)
+    with fake:
+        flask_main = load_app(fake.url)
+        server = make_server("127.0.0.1", 0, flask_main.app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = "http://127.0.0.1:{}".format(server.server_port)
+        cookie = session_cookie(flask_main.app)
+        summaries = [i["summary"] for i in fake.calendars.values()]
+
+        timings = Timings()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.users) as pool:
+            jobs = [pool.submit(run_meeting, base, cookie, timings, args.responders, summaries)
+                    for _ in range(args.meetings)]
+            for job in jobs:
+                job.result()
+        seconds = time.perf_counter() - start
+        server.shutdown()
+
+    print("{} meetings, {} responders each, {} at once, {:.0f}ms Google latency: {:.1f}s".format(
+        args.meetings, args.responders, args.users, args.latency * 1000, seconds))
+    print("{:>18} {:>8} {:>8} {:>9} {:>9} {:>7}".format(
+        "route", "requests", "req/s", "p50 ms", "p99 ms", "failed"))
+    total = 0
+    for route, values in timings.seconds.items():
+        values.sort()
+        total += len(values)
+        print("{:>18} {:>8} {:>8.1f} {:>9.1f} {:>9.1f} {:>7}".format(
+            route, len(values), len(values) / seconds, percentile(values, 0.5) * 1000,
+            percentile(values, 0.99) * 1000, timings.failed.get(route, 0)))
+    print("{:>18} {:>8} {:>8.1f}".format("all", total, total / seconds))
+    print("Google calendar requests: {} calendar lists, {} event pages".format(
+        fake.count("calendarList"), fake.count("events")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# Scaling benchmark of the free time functions, in both engines (free and
+# epoch_free), over generated workloads, checked against a stored baseline.
+# Run as "python -m tests.bench_scaling" from the "meetings" directory.
+#     --save         record this run as the new baseline
+#     --quick        leave out the biggest cases
+#     --tolerance 2  fail only on cases more than twice the baseline
+# Author Sam Champer
+#
+# Workloads vary along one axis at a time from a middle case of 1000
+# events over 30 days:
+#   events:     how many busy times there are, 10 to 100k.
+#   days:       length of the date range, 1 to 365.
+#   overlap:    how many events cover each moment on average, before
+#               merging. 0.1 is mostly free, 10 is one solid block.
+#   responders: how many people's busy times the events are split
+#               between. Each person's times are merged, as they are
+#               when saved, then everyone's are put together, which is
+#               what db_free gets from the database.
+# For each case and function, the best time of a few runs is printed,
+# along with the peak memory of one run (measured separately, since
+# tracemalloc slows everything down). Along the events and days axes,
+# the slope of log(time) against log(size) shows how each function
+# scales: 1 is linear, 2 is quadratic.
+#
+# The run fails (exits with 1) if a case is slower, or needs more memory,
+# than the baseline by more than the tolerance. Times depend on the
+# machine, so record a new baseline (--save) on whatever machine runs
+# the comparison.
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import arrow
+
+import epoch_free
+import free
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_scaling_baseline.json")
+
+MIDDLE = {"events": 1000, "days": 30, "overlap": 1, "responders": 1}
+AXES = {
+    "events": [10, 100, 1000, 10000, 100000],
+    "days": [1, 7, 30, 90, 365],
+    "overlap": [0.1, 0.5, 1, 2, 10],
+    "responders": [1, 2, 5, 10, 50],
+}
+# Cases bigger than this are left out with --quick.
+QUICK_EVENTS = 10000
+
+# Differences smaller than these are noise, whatever the ratio.
+MIN_SECONDS = 0.002
+MIN_BYTES = 64 * 1024
+
+_ZONE = timezone(timedelta(hours=-8))
+_START = int(datetime(2017, 11, 21, tzinfo=_ZONE).timestamp())
+
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, _ZONE).isoformat()
+
+
+def merge(intervals):
+    """
+    Merge sorted [start, end] pairs of ints, the same way both engines do.
+    """
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def make_workload(events, days, overlap, responders, seed=0):
+    """
+    Random busy times for one case.
+    :return: (events as [summary, iso_start, iso_end] lists, as one
+              calendar would give them, and everyone's merged busy
+              times as [iso_start, iso_end] lists, as the database has them)
+    """
+    rng = random.Random(seed)
+    span = days * 24 * 60 * 60
+    # Average length that gives the asked for overlap, at least a second.
+    length = max(overlap * span / events, 1)
+    raw = []
+    for _ in range(events):
+        start = _START + rng.randrange(span)
+        raw.append((start, start + max(int(length * rng.uniform(0.5, 1.5)), 1)))
+
+    calendar = [["Event", iso(start), iso(end)] for start, end in raw]
+    stored = []
+    for person in range(responders):
+        mine = sorted(raw[person::responders])
+        stored += [[iso(start), iso(end)] for start, end in merge(mine)]
+    return calendar, stored
+
+
+def legacy_day_range(days):
+    begin = arrow.get(_START).to(_ZONE)
+    return list(arrow.Arrow.range('day', begin, begin.shift(days=days - 1)))
+
+
+def epoch_day_range(days):
+    begin = arrow.get(_START).to(_ZONE)
+    return epoch_free.DayRange(begin, begin.shift(days=days - 1))
+
+
+def functions(calendar, stored, days):
+    """
+    Every function to time, as name -> a function making fresh
+    arguments (not timed) and the function to call with them.
+    The inputs for the inner steps come from running the steps
+    before them, as they do in free and db_free.
+    """
+    legacy_days = legacy_day_range(days)
+    epoch_days = epoch_day_range(days)
+
+    legacy_sorted = sorted(calendar, key=lambda i: arrow.get(i[1]))
+    legacy_merged = free.merge_events(legacy_sorted)
+    legacy_windows = free.free_list(legacy_merged, legacy_days)
+
+    epoch_sorted = sorted((epoch_free.parse_interval(i[1], i[2]) for i in calendar),
+                          key=lambda i: i[0])
+    epoch_merged = epoch_free.merge_intervals(epoch_sorted)
+    range_open = epoch_free.arrow_point(epoch_days[0])
+    range_close = epoch_free.arrow_point(epoch_days[-1])
+    epoch_windows = epoch_free.free_intervals(epoch_merged, range_open, range_close)
+
+    return {
+        "free.free": (lambda: (calendar, 9, 0, 17, 0, legacy_days, 30), free.free),
+        # db_free changes the lists it's given, so it gets fresh copies.
+        "free.db_free": (lambda: ([i[:] for i in stored], legacy_days, 30), free.db_free),
+        "free.merge_events": (lambda: (legacy_sorted,), free.merge_events),
+        "free.free_list": (lambda: (legacy_merged, legacy_days), free.free_list),
+        "free.crop_list": (lambda: (legacy_windows, 30), free.crop_list),
+        "epoch_free.free": (lambda: (calendar, 9, 0, 17, 0, epoch_days, 30), epoch_free.free),
+        "epoch_free.db_free": (lambda: (stored, epoch_days, 30), epoch_free.db_free),
+        "epoch_free.merge_intervals": (lambda: (epoch_sorted,), epoch_free.merge_intervals),
+        "epoch_free.free_intervals": (lambda: (epoch_merged, range_open, range_close),
+                                      epoch_free.free_intervals),
+        "epoch_free.crop_intervals": (lambda: (epoch_windows, 30), epoch_free.crop_intervals),
+    }
+
+
+def best_time(prepare, func, budget=0.5, most=5):
+    """
+    Best time of up to most runs, stopping once budget seconds have gone.
+    """
+    best = None
+    spent = 0
+    for _ in range(most):
+        args = prepare()
+        start = time.perf_counter()
+        func(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        spent += seconds
+        if spent >= budget:
+            break
+    return best
+
+
+def peak_memory(prepare, func):
+    """
+    Most memory allocated at once during one run, over what the arguments take.
+    """
+    args = prepare()
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def cases(quick):
+    """
+    Every case, as (axis, case dict), varying one axis at a time.
+    The middle case is only run once.
+    """
+    seen = set()
+    for axis, values in AXES.items():
+        for value in values:
+            case = dict(MIDDLE, **{axis: value})
+            key = case_key(case)
+            if quick and case["events"] > QUICK_EVENTS or key in seen:
+                continue
+            seen.add(key)
+            yield axis, case
+
+
+def case_key(case):
+    return "events={events} days={days} overlap={overlap} responders={responders}".format(**case)
+
+
+def run(quick):
+    """
+    Time every function on every case, printing as it goes.
+    :return: {case key: {function: {"seconds": s, "peak_bytes": b}}}
+    """
+    results = {}
+    curves = {}
+    for axis, case in cases(quick):
+        calendar, stored = make_workload(**case)
+        timings = {}
+        print(case_key(case))
+        for name, (prepare, func) in functions(calendar, stored, case["days"]).items():
+            seconds = best_time(prepare, func)
+            peak = peak_memory(prepare, func)
+            timings[name] = {"seconds": seconds, "peak_bytes": peak}
+            print("    {:<28} {:>10.4f}s {:>10.0f}KB".format(name, seconds, peak / 1024))
+            curves.setdefault((axis, name), []).append((case[axis], seconds))
+        results[case_key(case)] = timings
+
+    # The middle case belongs to every axis, but was only run once.
+    middle = results[case_key(MIDDLE)]
+    for (axis, name), points in curves.items():
+        if MIDDLE[axis] not in [i[0] for i in points]:
+            points.append((MIDDLE[axis], middle[name]["seconds"]))
+            points.sort()
+    for axis in ("events", "days"):
+        print("\nScaling with {} (slope of log time against log {}):".format(axis, axis))
+        for (curve_axis, name), points in curves.items():
+            if curve_axis == axis:
+                print("    {:<28} {:>5.2f}".format(name, slope(points)))
+    return results
+
+
+def slope(points):
+    """
+    Least squares slope of log(y) against log(x).
+    """
+    xs = [math.log(x) for x, y in points]
+    ys = [math.log(max(y, 1e-9)) for x, y in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Cases that got slower or bigger than the baseline by more than tolerance.
+    Cases missing from the baseline are left alone.
+    :return: a list of lines describing each regression.
+    """
+    found = []
+    for key, timings in results.items():
+        for name, now in timings.items():
+            before = baseline.get(key, {}).get(name)
+            if before is None:
+                continue
+            if (now["seconds"] > before["seconds"] * tolerance
+                    and now["seconds"] - before["seconds"] > MIN_SECONDS):
+                found.append("{} {}: {:.4f}s, was {:.4f}s".format(
+                    key, name, now["seconds"], before["seconds"]))
+            if (now["peak_bytes"] > before["peak_bytes"] * tolerance
+                    and now["peak_bytes"] - before["peak_bytes"] > MIN_BYTES):
+                found.append("{} {}: {:.0f}KB, was {:.0f}KB".format(
+                    key, name, now["peak_bytes"] / 1024, before["peak_bytes"] / 1024))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the free time functions")
+    parser.add_argument("--save", action="store_true", help="Save this run as the baseline")
+    parser.add_argument("--quick", action="store_true",
+                        help="Leave out cases with more than {} events".format(QUICK_EVENTS))
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="How many times the baseline counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as saved:
+                baseline = json.load(saved)
+        # A quick run only replaces the cases it ran.
+        baseline.update(results)
+        with open(args.baseline, "w") as saved:
+            json.dump(baseline, saved, indent=1, sort_keys=True)
+            saved.write("\n")
+        print("\nSaved baseline to {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline at {}; run with --save to make one".format(args.baseline))
+        return 0
+    with open(args.baseline) as saved:
+        found = regressions(results, json.load(saved), args.tolerance)
+    if found:
+        print("\n{} regressions against {}:".format(len(found), args.baseline))
+        for line in found:
+            print("    " + line)
+        return 1
+    print("\nNo regressions against {}".format(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
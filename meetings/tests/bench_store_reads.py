@@ -0,0 +1,50 @@
+# Benchmark of how many bytes each route reads from the database for
+# one meeting, reading whole documents (the old way) against the
+# projected reads in meeting_store, on an in-memory seeded collection.
+# Run as "python -m tests.bench_store_reads" from the "meetings" directory.
+# Author Sam Champer
+
+import arrow
+import bson
+import mongomock
+
+import meeting_store
+
+
+def seed(collection, code, responders, busy_each):
+    """
+    A meeting where responders have each sent busy_each busy times.
+    """
+    collection.insert_one(meeting_store.new_meeting(code))
+    people = ["Person {}".format(i) for i in range(responders)]
+    meeting_store.set_details(collection, code, people, "A meeting", 60,
+                              "11/21/2017 - 12/21/2017")
+    first = arrow.get("2017-11-21T00:00:00-08:00")
+    for i, person in enumerate(people):
+        busy = []
+        for j in range(busy_each):
+            begin = first.shift(hours=j * 3, minutes=i)
+            busy.append([begin.isoformat(), begin.shift(hours=1).isoformat()])
+        meeting_store.add_response(collection, code, person, busy)
+    meeting_store.current_index(collection, code)
+
+
+def size(doc):
+    return len(bson.encode(doc))
+
+
+def main():
+    print("{:>10} {:>6} | {:>10} | {:>9} {:>9} {:>9}".format(
+        "responders", "busy", "whole doc", "populate", "events", "status"))
+    for responders, busy_each in [(3, 20), (10, 100), (50, 200)]:
+        collection = mongomock.MongoClient().db.meetings
+        seed(collection, "code", responders, busy_each)
+        whole = size(collection.find_one({"code": "code"}))
+        routes = [size(meeting_store.read(collection, "code", i))
+                  for i in ["populate", "events", "status"]]
+        print("{:>10} {:>6} | {:>10} | {:>9} {:>9} {:>9}".format(
+            responders, busy_each, whole, *routes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# A fake Google calendar v3 server, so that calendar fetching can be
+# tested and benchmarked offline, with a known number of round trips.
+# Author Sam Champer
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse as url_parse
+
+import arrow
+import httplib2
+
+import gcal
+from epoch_free import parse_point
+
+
+class FakeCalendar:
+    """
+    Serves calendarList.list, events.list and freebusy.query for a dict of
+    calendars: {cal_id: {"summary": str, "events": [event dict, ...]}}
+    Every request sleeps for latency seconds, and is logged in requests.
+    """
+    def __init__(self, calendars, latency=0.0, page_size=250):
+        self.calendars = calendars
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/calendar/v3/".format(self.server.server_port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def service(self):
+        """
+        A calendar service object that talks to this server.
+        """
+        return gcal.build_service(httplib2.Http(), self.url)
+
+    def count(self, kind):
+        """
+        The number of requests made of one kind: "calendarList", "events" or "freeBusy".
+        """
+        return len([i for i in self.requests if i == kind])
+
+    def log(self, kind):
+        with self.lock:
+            self.requests.append(kind)
+
+    def calendar_list(self):
+        items = []
+        for cal_id, cal in self.calendars.items():
+            items.append({"kind": "calendar#calendarListEntry",
+                          "id": cal_id,
+                          "summary": cal["summary"],
+                          "selected": cal.get("selected", True),
+                          "primary": cal.get("primary", False)})
+        return {"items": items}
+
+    def events(self, cal_id, query):
+        """
+        One page of the events in a calendar overlapping timeMin to timeMax.
+        """
+        time_min, _ = parse_point(query["timeMin"])
+        time_max, _ = parse_point(query["timeMax"])
+        matching = [i for i in self.calendars[cal_id]["events"]
+                    if _bounds(i)[0] < time_max and _bounds(i)[1] > time_min]
+        size = min(self.page_size, int(query.get("maxResults", self.page_size)))
+        first = int(query.get("pageToken", 0))
+        page = {"items": matching[first:first + size]}
+        if first + size < len(matching):
+            page["nextPageToken"] = str(first + size)
+        return page
+
+    def freebusy(self, body):
+        """
+        Busy times for each calendar in a freebusy query.
+        """
+        time_min, _ = parse_point(body["timeMin"])
+        time_max, _ = parse_point(body["timeMax"])
+        calendars = {}
+        for item in body["items"]:
+            busy = []
+            for event in self.calendars[item["id"]]["events"]:
+                start, end = _bounds(event)
+                if start < time_max and end > time_min:
+                    busy.append({"start": event["start"]["dateTime"],
+                                 "end": event["end"]["dateTime"]})
+            calendars[item["id"]] = {"busy": busy}
+        return {"calendars": calendars}
+
+
+def _bounds(event):
+    return (parse_point(event["start"]["dateTime"])[0],
+            parse_point(event["end"]["dateTime"])[0])
+
+
+def _handler(fake):
+    """
+    Request handler class bound to a FakeCalendar.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = url_parse.urlsplit(self.path)
+            query = dict(url_parse.parse_qsl(url.query))
+            parts = [url_parse.unquote(i) for i in url.path.split("/") if i]
+            # Paths look like calendar/v3/users/me/calendarList
+            # and calendar/v3/calendars/<cal_id>/events
+            if parts[2:] == ["users", "me", "calendarList"]:
+                fake.log("calendarList")
+                self.reply(fake.calendar_list())
+            elif len(parts) == 5 and parts[2] == "calendars" and parts[4] == "events":
+                fake.log("events")
+                self.reply(fake.events(parts[3], query))
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if url_parse.urlsplit(self.path).path.endswith("/freeBusy"):
+                fake.log("freeBusy")
+                self.reply(fake.freebusy(body))
+            else:
+                self.send_error(404)
+
+        def reply(self, result):
+            time.sleep(fake.latency)
+            data = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def make_calendars(num_calendars, events_per_day, days, start="2017-11-21T00:00:00-08:00"):
+    """
+    Calendars full of hour long events, spread evenly from 8am.
+    """
+    first = arrow.get(start)
+    calendars = {}
+    for c in range(num_calendars):
+        events = []
+        for d in range(days):
+            for e in range(events_per_day):
+                begin = first.shift(days=d, hours=8 + e % 12, minutes=c * 5)
+                events.append({"summary": "Event {} {} {}".format(c, d, e),
+                               "start": {"dateTime": begin.isoformat()},
+                               "end": {"dateTime": begin.shift(hours=1).isoformat()}})
+        calendars["cal{}@example.com".format(c)] = {"summary": "Calendar {}".format(c),
+                                                   "events": events}
+    return calendars
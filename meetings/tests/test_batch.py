@@ -0,0 +1,124 @@
+# Nose tests for working out free times for many meetings at once.
+# Author Sam Champer
+
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+
+from bson import json_util
+import mongomock
+
+import batch
+import meeting_store
+from epoch_free import index_free
+from tests.test_meeting_store import busy_for
+
+
+def make_meetings(count):
+    """
+    An in-memory collection of meetings, each with a few responses,
+    plus one that hasn't been set up yet.
+    """
+    collection = mongomock.MongoClient().db.meetings
+    for i in range(count):
+        code = "code{}".format(i)
+        collection.insert_one(meeting_store.new_meeting(code))
+        meeting_store.set_details(collection, code, ["a", "b"], "desc", 30,
+                                  "11/21/2017 - 11/27/2017")
+        meeting_store.add_response(collection, code, "a", busy_for(0, i % 5))
+        meeting_store.add_response(collection, code, "b", busy_for(1, 3))
+    collection.insert_one(meeting_store.new_meeting("unset"))
+    return collection
+
+
+def expected_free(collection, code):
+    """
+    Free times the way the status page works them out.
+    """
+    record = meeting_store.read(collection, code, "events")
+    free = index_free(meeting_store.current_index(collection, code),
+                      meeting_store.day_range(record), record["duration"])
+    return [[i[0].isoformat(), i[1].isoformat()] for i in free]
+
+
+class OneByOne:
+    """
+    Applies bulk writes one update at a time, since mongomock
+    can't take the bulk writes of newer versions of pymongo.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        self.bulk_writes = 0
+
+    def bulk_write(self, requests, ordered=True):
+        self.bulk_writes += 1
+        matched = sum(self.collection.update_one(i._filter, i._doc).matched_count
+                      for i in requests)
+        return SimpleNamespace(matched_count=matched)
+
+
+def test_mongo_round_trip():
+    """
+    Free times are saved to every meeting that's set up, and match
+    the status page. Meetings changed since they were read are left alone.
+    """
+    collection = make_meetings(12)
+    records = list(batch.mongo_records(collection))
+    # Somebody responds after the batch has read the meeting.
+    meeting_store.add_response(collection, "code3", "c", busy_for(2, 2))
+    writer = OneByOne(collection)
+    done, skipped, _ = batch.run(records, batch.mongo_writer(writer), workers=2, batch_size=5)
+    # The changed meeting isn't counted as saved.
+    assert (done, skipped) == (11, 1)
+    # One bulk write a batch.
+    assert writer.bulk_writes == 3
+    for i in range(12):
+        record = collection.find_one({"code": "code{}".format(i)})
+        if i == 3:
+            assert "free_times" not in record
+        else:
+            assert record["free_times"] == expected_free(collection, record["code"])
+            assert record["free_version"] == record["version"]
+
+
+def test_meeting_without_version():
+    """
+    A meeting saved before meetings had versions gets its free times saved.
+    """
+    collection = mongomock.MongoClient().db.meetings
+    collection.insert_one({"type": "meeting", "code": "old", "busy": busy_for(0, 4),
+                           "participants": ["a"], "already_checked_in": [],
+                           "duration": 30, "daterange": "11/21/2017 - 11/27/2017"})
+    done, skipped, _ = batch.run(batch.mongo_records(collection),
+                                 batch.mongo_writer(OneByOne(collection)), workers=2)
+    assert (done, skipped) == (1, 0)
+    record = collection.find_one({"code": "old"})
+    assert "version" not in record
+    assert record["free_version"] == 0
+    assert record["free_times"] == expected_free(collection, "old")
+
+
+def test_dump_to_ndjson():
+    """
+    Meetings can come from a dump, as lines or as an array.
+    """
+    collection = make_meetings(4)
+    records = list(collection.find({}, {"_id": 0}))
+    with tempfile.TemporaryDirectory() as tmp:
+        lines = os.path.join(tmp, "lines.json")
+        with open(lines, "w") as dump:
+            dump.write("".join(json_util.dumps(i) + "\n\n" for i in records))
+        array = os.path.join(tmp, "array.json")
+        with open(array, "w") as dump:
+            dump.write("  " + json_util.dumps(records))
+        for path in (lines, array):
+            out = io.StringIO()
+            done, skipped, _ = batch.run(batch.dump_records(path), batch.ndjson_writer(out),
+                                         workers=2, batch_size=3)
+            assert (done, skipped) == (4, 1)
+            results = sorted((json_util.loads(i) for i in out.getvalue().splitlines()),
+                             key=lambda i: i["code"])
+            assert [i["code"] for i in results] == ["code0", "code1", "code2", "code3"]
+            for i in results:
+                assert i["free"] == expected_free(collection, i["code"])
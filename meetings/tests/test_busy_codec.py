@@ -0,0 +1,22 @@
+# Nose tests for the packed busy time format.
+# Author Sam Champer
+
+import busy_codec
+
+
+def test_round_trip():
+    """
+    Pairs come back out exactly as they went in, in 16 bytes each.
+    """
+    pairs = [[1511287200, 1511290800], [-5, 0], [2 ** 40, 2 ** 40 + 1]]
+    blob = busy_codec.pack(pairs)
+    assert len(blob) == 16 * len(pairs)
+    assert busy_codec.unpack(blob) == pairs
+    assert list(busy_codec.unpack_flat(blob)) == [i for pair in pairs for i in pair]
+
+
+def test_empty():
+    """
+    No busy times packs down to nothing.
+    """
+    assert busy_codec.unpack(busy_codec.pack([])) == []
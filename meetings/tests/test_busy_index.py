@@ -0,0 +1,65 @@
+# Nose tests for the merged busy time index.
+# Author Sam Champer
+
+import random
+
+import arrow
+import busy_index
+import epoch_free
+
+day_range = list(arrow.Arrow.range('day',
+                                   arrow.get("2017-11-21T00:00:00-08:00"),
+                                   arrow.get("2017-11-27T00:00:00-08:00")))
+
+
+def random_busy(count, seed):
+    """
+    A reproducible list of busy times scattered over the test week.
+    """
+    rng = random.Random(seed)
+    busy = []
+    for _ in range(count):
+        start = day_range[0].shift(minutes=rng.randrange(0, 7 * 24 * 60, 15))
+        end = start.shift(minutes=rng.randrange(15, 600, 15))
+        busy.append([start.isoformat(), end.isoformat()])
+    return busy
+
+
+def test_insert_matches_build():
+    """
+    Splicing submissions in one at a time gives the same
+    index as merging everything at once.
+    """
+    for seed in range(10):
+        busy = random_busy(100, seed)
+        index = busy_index.build([])
+        for i in range(0, len(busy), 7):
+            busy_index.insert(index, busy[i:i + 7])
+        assert index == busy_index.build(busy)
+
+
+def test_touching_intervals_merge():
+    """
+    Intervals that only touch end to end become one interval.
+    """
+    index = []
+    busy_index.add(index, 10, 20)
+    busy_index.add(index, 30, 40)
+    busy_index.add(index, 20, 30)
+    assert index == [[10, 40]]
+    busy_index.add(index, 0, 5)
+    busy_index.add(index, 50, 60)
+    busy_index.add(index, 1, 55)
+    assert index == [[0, 60]]
+
+
+def test_index_free_matches_db_free():
+    """
+    Free times from the index agree with db_free.
+    """
+    for seed in range(10):
+        busy = random_busy(50, seed)
+        from_index = epoch_free.index_free(busy_index.build(busy), day_range, 30)
+        from_busy = epoch_free.db_free(busy, day_range, 30)
+        assert [[i[0].timestamp(), i[1].timestamp()] for i in from_index] == \
+               [[i[0].timestamp(), i[1].timestamp()] for i in from_busy]
@@ -0,0 +1,165 @@
+# Nose tests checking that the epoch engine agrees with free.
+# Author Sam Champer
+
+import copy
+import random
+
+import arrow
+import free
+import epoch_free
+
+day_range = list(arrow.Arrow.range('day',
+                                   arrow.get("2017-11-21T00:00:00-08:00"),
+                                   arrow.get("2017-11-27T00:00:00-08:00")))
+
+
+def as_iso(windows):
+    """
+    Arrow windows to iso strings, so results can be compared.
+    """
+    return [[i[0].isoformat(), i[1].isoformat()] for i in windows]
+
+
+def random_events(count, seed):
+    """
+    A reproducible list of events scattered over the test week.
+    """
+    rng = random.Random(seed)
+    base = day_range[0].shift(days=-1)
+    events = []
+    for _ in range(count):
+        start = base.shift(minutes=rng.randrange(0, 9 * 24 * 60, 10))
+        end = start.shift(minutes=rng.randrange(10, 300, 10))
+        events.append(['Event', start.isoformat(), end.isoformat()])
+    return events
+
+
+def test_free_matches():
+    """
+    Free windows and db busy times match the arrow engine.
+    """
+    for seed in range(10):
+        events = random_events(40, seed)
+        old_free, old_busy = free.free(events, 9, 0, 17, 0, day_range, 30)
+        new_free, new_busy = epoch_free.free(events, 9, 0, 17, 0, day_range, 30)
+        assert as_iso(new_free) == as_iso(old_free)
+        assert new_busy == old_busy
+
+
+def test_db_free_matches():
+    """
+    db_free agrees with the arrow engine, and leaves its input alone.
+    """
+    for seed in range(10):
+        busy = [i[1:] for i in random_events(60, seed)]
+        untouched = copy.deepcopy(busy)
+        new_free = epoch_free.db_free(busy, day_range, 45)
+        assert busy == untouched
+        old_free = free.db_free(busy, day_range, 45)
+        assert as_iso(new_free) == as_iso(old_free)
+
+
+def test_db_free_empty():
+    """
+    With nobody busy, the whole range is free.
+    """
+    windows = epoch_free.db_free([], day_range, 30)
+    assert as_iso(windows) == [[day_range[0].isoformat(), day_range[-1].isoformat()]]
+
+
+def test_day_range():
+    """
+    DayRange acts like the list from arrow.Arrow.range.
+    """
+    lazy = epoch_free.DayRange(day_range[0], day_range[-1])
+    assert len(lazy) == len(day_range)
+    assert list(lazy) == day_range
+    assert lazy[0] == day_range[0]
+    assert lazy[-1] == day_range[-1]
+    assert len(epoch_free.DayRange(day_range[-1], day_range[0])) == 0
+
+
+def test_long_range():
+    """
+    The closed hours mask gives the same answer as
+    blocking out nights over a quarter long range.
+    """
+    long_range = list(arrow.Arrow.range('day', day_range[0], day_range[0].shift(days=90)))
+    lazy = epoch_free.DayRange(long_range[0], long_range[-1])
+    events = random_events(80, 3)
+    old_free, old_busy = free.free(events, 8, 30, 18, 15, long_range, 60)
+    new_free, new_busy = epoch_free.free(events, 8, 30, 18, 15, lazy, 60)
+    assert as_iso(new_free) == as_iso(old_free)
+    assert new_busy == old_busy
+
+
+def test_event_free():
+    """
+    Parsed Events sorted by start time give the same answer as free.
+    """
+    for seed in range(5):
+        events = random_events(60, seed)
+        parsed = sorted((epoch_free.parse_event(*i) for i in events), key=lambda e: e.start)
+        new_free, new_busy = epoch_free.event_free(parsed, 9, 0, 17, 0, day_range, 30)
+        old_free, old_busy = free.free(events, 9, 0, 17, 0, day_range, 30)
+        assert as_iso(new_free) == as_iso(old_free)
+        assert new_busy == old_busy
+
+
+def test_gaps():
+    """
+    The lazy gaps give the same windows as free_intervals.
+    """
+    for seed in range(5):
+        busy = sorted((epoch_free.parse_interval(i[1], i[2]) for i in random_events(40, seed)),
+                      key=lambda i: i[0])
+        merged = epoch_free.merge_intervals(busy)
+        range_open = epoch_free.arrow_point(day_range[0])
+        range_close = epoch_free.arrow_point(day_range[-1])
+        assert list(epoch_free.gaps(iter(merged), range_open, range_close)) == \
+            epoch_free.free_intervals(merged, range_open, range_close)
+
+
+def test_best_slots():
+    """
+    The best meeting times for each preference.
+    """
+    # Busy every night from 5pm to 9am, and 10am to 11:30am on the 21st.
+    index = [[int(day.shift(hours=-7).timestamp()), int(day.shift(hours=9).timestamp())]
+             for day in day_range]
+    index.insert(1, [int(day_range[0].shift(hours=10).timestamp()),
+                     int(day_range[0].shift(hours=11, minutes=30).timestamp())])
+
+    def times(best):
+        return [i[0].format("D HH:mm") + "-" + i[1].format("HH:mm") for i in best]
+
+    best = epoch_free.best_slots(index, day_range, 60, 3)
+    assert times(best) == ["21 09:00-10:00", "21 11:30-12:30", "21 11:45-12:45"]
+    # 45 minutes doesn't go into the hour before 10am, so take the latest that fits.
+    best = epoch_free.best_slots(index, day_range, 45, 3, step=30)
+    assert times(best) == ["21 09:00-09:45", "21 09:15-10:00", "21 11:30-12:15"]
+    best = epoch_free.best_slots(index, day_range, 60, 3, ["midday"])
+    assert times(best) == ["21 11:30-12:30", "22 11:30-12:30", "23 11:30-12:30"]
+    best = epoch_free.best_slots(index, day_range, 60, 4, ["fragmentation", "midday"])
+    assert times(best) == ["21 11:30-12:30", "21 09:00-10:00", "22 09:00-10:00", "23 09:00-10:00"]
+    # Nothing long enough, nothing found.
+    assert epoch_free.best_slots(index, day_range, 9 * 60, 3) == []
+
+
+def test_best_slots_agree():
+    """
+    Every best time is inside one of the free windows from index_free,
+    and the earliest come out in order from the start of the first window.
+    """
+    for seed in range(5):
+        busy = [i[1:] for i in random_events(30, seed)]
+        index = [[i[0], i[1]] for i in epoch_free.merge_intervals(sorted(
+            (epoch_free.parse_interval(*i) for i in busy), key=lambda i: i[0]))]
+        windows = epoch_free.index_free(index, day_range, 30)
+        for prefer in (["earliest"], ["midday"], ["fragmentation"]):
+            for start, end in epoch_free.best_slots(index, day_range, 30, 10, prefer):
+                assert (end - start).total_seconds() == 30 * 60
+                assert any(w[0] <= start and end <= w[1] for w in windows)
+        best = epoch_free.best_slots(index, day_range, 30, 10)
+        assert best[0][0] == windows[0][0]
+        assert best == sorted(best)
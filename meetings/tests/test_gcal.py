@@ -0,0 +1,173 @@
+# Nose tests for fetching events from Google calendar,
+# run against a fake calendar server.
+# Author Sam Champer
+
+from concurrent import futures
+import copy
+import time
+
+import arrow
+
+from epoch_free import parse_event
+import gcal
+from tests.fake_gcal import FakeCalendar, make_calendars
+
+day_range = list(arrow.Arrow.range('day',
+                                   arrow.get("2017-11-21T00:00:00-08:00"),
+                                   arrow.get("2017-11-27T00:00:00-08:00")))
+
+
+def test_list_events_pages():
+    """
+    One calendar over the whole range is one query per page,
+    and every event comes back exactly once.
+    """
+    calendars = make_calendars(1, 10, 7)
+    with FakeCalendar(calendars, page_size=25) as fake:
+        found = list(gcal.list_events(fake.service(), "cal0@example.com",
+                                      day_range[0].isoformat(),
+                                      day_range[-1].shift(days=1).isoformat()))
+        assert len(found) == 70
+        assert fake.count("events") == 3
+
+
+def test_event_times():
+    """
+    Timed and all day events both give a summary, start and finish.
+    """
+    timed = {"summary": "A", "start": {"dateTime": "2017-11-21T10:00:00-08:00"},
+             "end": {"dateTime": "2017-11-21T11:00:00-08:00"}}
+    assert gcal.event_times(timed) == ["A", "2017-11-21T10:00:00-08:00",
+                                       "2017-11-21T11:00:00-08:00"]
+    all_day = {"summary": "B", "start": {"date": "2017-11-21"}, "end": {"date": "2017-11-22"}}
+    assert gcal.event_times(all_day)[0] == "B"
+    assert gcal.event_times({"summary": "C", "start": {}}) is None
+
+
+def test_in_windows():
+    """
+    Only events overlapping the daily open hours are kept.
+    """
+    windows = gcal.open_windows(9, 0, 17, 0, day_range)
+    assert gcal.in_windows(parse_event("", "2017-11-21T08:00:00-08:00", "2017-11-21T09:30:00-08:00"), windows)
+    assert gcal.in_windows(parse_event("", "2017-11-22T16:30:00-08:00", "2017-11-22T20:00:00-08:00"), windows)
+    assert not gcal.in_windows(parse_event("", "2017-11-21T17:00:00-08:00", "2017-11-22T09:00:00-08:00"), windows)
+    assert not gcal.in_windows(parse_event("", "2017-11-28T10:00:00-08:00", "2017-11-28T11:00:00-08:00"), windows)
+
+
+def test_fetch_pool_concurrent():
+    """
+    Calendars are fetched at the same time, each thread has
+    its own service object, and results keep calendar order.
+    """
+    calendars = make_calendars(4, 3, 7)
+    cal_ids = sorted(calendars, reverse=True)
+    with FakeCalendar(calendars, latency=0.2) as fake:
+        made = []
+
+        def make_service():
+            made.append(1)
+            return fake.service()
+
+        begin = time.monotonic()
+        with gcal.FetchPool(make_service, 4, 10) as pool:
+            found = pool.events(cal_ids, day_range[0].isoformat(), day_range[-1].isoformat())
+        assert time.monotonic() - begin < 0.6
+        assert len(made) == 4
+        assert [i[0]["summary"].split()[1] for i in found] == [i[3] for i in cal_ids]
+
+
+def test_fetch_pool_deadline():
+    """
+    Waiting on a slow calendar gives up at the deadline.
+    """
+    with FakeCalendar(make_calendars(1, 1, 1), latency=1) as fake:
+        begin = time.monotonic()
+        with gcal.FetchPool(fake.service, 2, 0.2) as pool:
+            try:
+                pool.events(["cal0@example.com"], day_range[0].isoformat(),
+                            day_range[-1].isoformat())
+                assert False, "should have timed out"
+            except futures.TimeoutError:
+                pass
+        assert time.monotonic() - begin < 0.6
+
+
+def test_free_busy():
+    """
+    The freebusy query gets the same busy times as listing
+    events, for all the calendars in a single request.
+    """
+    calendars = make_calendars(3, 5, 7)
+    cal_ids = sorted(calendars)
+    time_min, time_max = day_range[0].isoformat(), day_range[-1].isoformat()
+    with FakeCalendar(calendars) as fake:
+        service = fake.service()
+        busy = gcal.free_busy(service, cal_ids, time_min, time_max)
+        assert fake.count("freeBusy") == 1
+        listed = []
+        for cal_id in cal_ids:
+            listed.extend(gcal.event_times(i)[1:] for i in
+                          gcal.list_events(service, cal_id, time_min, time_max))
+    assert [i[1:] for i in busy] == listed
+    assert set(i[0] for i in busy) == {"Busy"}
+
+
+def test_discovery_document_cached():
+    """
+    The discovery document is parsed once and shared by every service.
+    """
+    assert gcal.discovery_document() is gcal.discovery_document()
+    assert gcal.discovery_document()["name"] == "calendar"
+
+
+def test_discovery_document_ready_to_share():
+    """
+    Building and using services doesn't change the shared document,
+    so services can be built from it in several threads at once.
+    """
+    import httplib2
+    doc = gcal.discovery_document()
+    before = copy.deepcopy(doc)
+    service = gcal.build_service(httplib2.Http())
+    service.events().list(calendarId="primary")
+    service.calendarList().list()
+    service.freebusy().query(body={})
+    service = gcal.build_service(httplib2.Http())
+    for name in ["acl", "calendars", "channels", "colors", "settings"]:
+        getattr(service, name)()
+    assert doc == before
+
+
+def test_events_as_completed():
+    """
+    Each calendar comes out as soon as it's fetched,
+    and every calendar comes out once.
+    """
+    calendars = make_calendars(3, 2, 7)
+    with FakeCalendar(calendars) as fake:
+        with gcal.FetchPool(fake.service, 3, 10) as pool:
+            found = dict(pool.events_as_completed(sorted(calendars), day_range[0].isoformat(),
+                                                  day_range[-1].isoformat()))
+    assert sorted(found) == sorted(calendars)
+    assert all(len(i) == 12 for i in found.values())
+
+
+def test_keep_events():
+    """
+    Events are parsed once, and repeats and events
+    outside of the open hours are dropped.
+    """
+    windows = gcal.open_windows(9, 0, 17, 0, day_range)
+    meeting = ["Meeting", "2017-11-21T10:00:00-08:00", "2017-11-21T11:00:00-08:00"]
+    # The same time written with a different offset is the same event.
+    same = ["Meeting", "2017-11-21T18:00:00+00:00", "2017-11-21T19:00:00+00:00"]
+    other = ["Lunch", "2017-11-21T10:00:00-08:00", "2017-11-21T11:00:00-08:00"]
+    night = ["Sleep", "2017-11-21T22:00:00-08:00", "2017-11-22T06:00:00-08:00"]
+    kept = {}
+    new = gcal.keep_events([meeting, None, night, meeting], windows, kept)
+    assert [i.summary for i in new] == ["Meeting"]
+    assert new[0] == parse_event(*meeting)
+    new = gcal.keep_events([same, other], windows, kept)
+    assert [i.summary for i in new] == ["Lunch"]
+    assert len(kept) == 2
@@ -0,0 +1,36 @@
+# Nose tests for counting busy times bucket by bucket.
+# Author Sam Champer
+
+import random
+
+import heatmap
+
+
+def test_occupancy():
+    """
+    Intervals count in every bucket they touch any part of,
+    and parts outside of the range are left out.
+    """
+    assert heatmap.occupancy([], 0, 600, 60) == [0] * 10
+    assert heatmap.occupancy([[0, 60], [30, 150], [-100, 10], [590, 900]], 0, 600, 60) == \
+        [3, 1, 1, 0, 0, 0, 0, 0, 0, 1]
+    # A range that isn't a whole number of buckets gets a short last bucket.
+    assert heatmap.occupancy([[0, 1000]], 0, 150, 60) == [1, 1, 1]
+    assert heatmap.bucket_count(0, 150, 60) == 3
+    assert heatmap.bucket_count(150, 0, 60) == 0
+
+
+def test_agrees_with_counting():
+    """
+    The difference array gives the same counts as
+    checking every interval against every bucket.
+    """
+    rng = random.Random(3)
+    intervals = []
+    for _ in range(500):
+        start = rng.randrange(-5000, 100000)
+        intervals.append([start, start + rng.randrange(1, 8000)])
+    counts = heatmap.occupancy(intervals, 0, 86400, 3600)
+    expected = [sum(1 for s, e in intervals if s < b + 3600 and e > b)
+                for b in range(0, 86400, 3600)]
+    assert counts == expected
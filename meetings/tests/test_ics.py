@@ -0,0 +1,145 @@
+# Nose tests for reading busy times out of calendar files.
+# Author Sam Champer
+
+from datetime import datetime
+from itertools import islice
+
+from dateutil import tz
+
+import ics
+
+LA = tz.gettz("America/Los_Angeles")
+range_start = datetime(2017, 10, 30, tzinfo=LA)
+range_end = datetime(2017, 11, 18, tzinfo=LA)
+
+CALENDAR = """BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VTIMEZONE
+TZID:America/Los_Angeles
+BEGIN:STANDARD
+DTSTART:20171105T020000
+TZOFFSETFROM:-0700
+TZOFFSETTO:-0800
+END:STANDARD
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:one
+SUMMARY:Dentist with a very long
+  name
+DTSTART:20171101T170000Z
+DTEND:20171101T180000Z
+BEGIN:VALARM
+TRIGGER:-PT15M
+DTSTART:20000101T000000Z
+END:VALARM
+END:VEVENT
+BEGIN:VEVENT
+UID:standup
+SUMMARY:Standup
+DTSTART;TZID=America/Los_Angeles:20171002T090000
+DURATION:PT15M
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20171109T000000Z
+EXDATE;TZID=America/Los_Angeles:20171101T090000
+END:VEVENT
+BEGIN:VEVENT
+UID:standup
+SUMMARY:Standup (moved)
+RECURRENCE-ID;TZID=America/Los_Angeles:20171106T090000
+DTSTART;TZID=America/Los_Angeles:20171106T140000
+DTEND;TZID=America/Los_Angeles:20171106T141500
+END:VEVENT
+BEGIN:VEVENT
+UID:holiday
+SUMMARY:Day off
+DTSTART;VALUE=DATE:20171110
+END:VEVENT
+BEGIN:VEVENT
+UID:free
+SUMMARY:Maybe
+TRANSP:TRANSPARENT
+DTSTART:20171102T170000Z
+DTEND:20171102T180000Z
+END:VEVENT
+BEGIN:VEVENT
+UID:gone
+SUMMARY:Cancelled
+STATUS:CANCELLED
+DTSTART:20171103T170000Z
+DTEND:20171103T180000Z
+END:VEVENT
+BEGIN:VEVENT
+UID:old
+SUMMARY:Too early
+DTSTART:20170101T170000Z
+DTEND:20170101T180000Z
+END:VEVENT
+BEGIN:VEVENT
+UID:gym
+SUMMARY:Gym
+DTSTART;TZID=America/Los_Angeles:20150101T060000
+DTEND;TZID=America/Los_Angeles:20150101T070000
+RRULE:FREQ=DAILY
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def busy(text=CALENDAR):
+    return list(ics.busy_times(text.splitlines(True), range_start, range_end))
+
+
+def test_single_events():
+    """
+    One off events in the range are busy, with long lines put back
+    together and free, cancelled and out of range events left out.
+    """
+    found = [i for i in busy() if i[0] not in ("Standup", "Gym")]
+    assert found == [
+        ["Dentist with a very long name", "2017-11-01T17:00:00+00:00", "2017-11-01T18:00:00+00:00"],
+        ["Standup (moved)", "2017-11-06T14:00:00-08:00", "2017-11-06T14:15:00-08:00"],
+        ["Day off", datetime(2017, 11, 10, tzinfo=tz.tzlocal()).isoformat(),
+         datetime(2017, 11, 11, tzinfo=tz.tzlocal()).isoformat()]]
+
+
+def test_recurring():
+    """
+    Recurrences stay at the same time of day across daylight saving,
+    stop at UNTIL, and skip cancelled and moved instances.
+    """
+    standups = [i[1] for i in busy() if i[0] == "Standup"]
+    assert standups == ["2017-10-30T09:00:00-07:00", "2017-11-08T09:00:00-08:00"]
+
+
+def test_stops_at_range():
+    """
+    A recurring event that never ends is only expanded over the range.
+    """
+    gym = [i[1] for i in busy() if i[0] == "Gym"]
+    assert len(gym) == 19
+    assert gym[0] == "2017-10-30T06:00:00-07:00"
+    assert gym[-1] == "2017-11-17T06:00:00-08:00"
+
+
+def test_lazy():
+    """
+    Events come out one at a time, so the first can be had
+    without reading the rest of the file.
+    """
+    def lines():
+        yield from CALENDAR.splitlines(True)[:22]
+        raise AssertionError("read too far")
+
+    first = next(ics.busy_times(lines(), range_start, range_end))
+    assert first[0] == "Dentist with a very long name"
+    assert list(islice(ics.expand(
+        {"DTSTART": ({}, "20171101T100000Z"), "RRULE": ({}, "FREQ=MINUTELY"), "EXDATE": []},
+        range_start, range_end), 3))[2][1] == "2017-11-01T10:02:00+00:00"
+
+
+def test_durations():
+    """
+    Durations in weeks, days, hours, minutes and seconds.
+    """
+    assert ics.parse_duration("PT1H30M").total_seconds() == 5400
+    assert ics.parse_duration("P1W2D").days == 9
+    assert ics.parse_duration("-PT15S").total_seconds() == -15
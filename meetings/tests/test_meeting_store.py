@@ -0,0 +1,209 @@
+# Nose tests for reading and writing meetings,
+# against an in-memory stand in for Mongo.
+# Author Sam Champer
+
+import threading
+
+import arrow
+import mongomock
+
+import busy_codec
+import busy_index
+import meeting_store
+
+start = arrow.get("2017-11-21T00:00:00-08:00")
+
+
+def busy_for(person, count):
+    """
+    count distinct, non-touching busy times for one person.
+    """
+    busy = []
+    for i in range(count):
+        begin = start.shift(hours=person * 100 + i * 2)
+        busy.append([begin.isoformat(), begin.shift(hours=1).isoformat()])
+    return busy
+
+
+def make_collection(record):
+    """
+    An in-memory collection holding one record.
+    """
+    collection = mongomock.MongoClient().db.meetings
+    collection.insert_one(record)
+    return collection
+
+
+def test_concurrent_responses():
+    """
+    Nobody's busy times or check in are lost when
+    lots of people respond at the same time.
+    """
+    people = ["p{}".format(i) for i in range(20)]
+    record = meeting_store.new_meeting("code")
+    record["participants"] = people[:]
+    collection = make_collection(record)
+
+    threads = [threading.Thread(target=meeting_store.add_response,
+                                args=(collection, "code", people[i], busy_for(i, 10)))
+               for i in range(len(people))]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+
+    record = collection.find_one({"code": "code"})
+    assert len(record["busy_log"]) == record["log_count"] == 20
+    assert record["participants"] == []
+    assert sorted(record["already_checked_in"]) == sorted(people)
+    assert record["version"] == 20
+    everyone = []
+    for i in range(len(people)):
+        everyone.extend(busy_for(i, 10))
+    assert meeting_store.current_index(collection, "code") == busy_index.build(everyone)
+
+
+def test_index_folds_in_new_busy():
+    """
+    current_index folds responses into the saved index.
+    """
+    record = meeting_store.new_meeting("code")
+    record["participants"] = ["a", "b"]
+    collection = make_collection(record)
+    meeting_store.add_response(collection, "code", "a", busy_for(0, 3))
+    assert meeting_store.current_index(collection, "code") == busy_index.build(busy_for(0, 3))
+    meeting_store.add_response(collection, "code", "b", busy_for(1, 3))
+    index = meeting_store.current_index(collection, "code")
+    assert index == busy_index.build(busy_for(0, 3) + busy_for(1, 3))
+    record = collection.find_one({"code": "code"})
+    assert busy_codec.unpack(record["merged"]) == index
+    assert record["merged_count"] == 2
+    # Each response's busy times can still be had on their own.
+    assert sorted(meeting_store.responses(collection, "code")) == \
+        sorted([busy_index.build(busy_for(0, 3)), busy_index.build(busy_for(1, 3))])
+
+
+def test_migrate_old_meeting():
+    """
+    Meetings saved before the busy log existed get migrated.
+    """
+    collection = make_collection({"code": "old", "busy": busy_for(0, 4),
+                                  "participants": ["a"], "already_checked_in": []})
+    meeting_store.add_response(collection, "old", "a", busy_for(1, 2))
+    record = collection.find_one({"code": "old"})
+    assert "busy" not in record
+    assert record["log_count"] == 2
+    assert busy_index.build(busy_for(0, 4)) in [busy_codec.unpack(i) for i in record["busy_log"]]
+    assert meeting_store.current_index(collection, "old") == \
+        busy_index.build(busy_for(0, 4) + busy_for(1, 2))
+
+
+def test_route_reads():
+    """
+    Each route reads only its own fields, and never busy times.
+    """
+    collection = make_collection(meeting_store.new_meeting("code"))
+    meeting_store.set_details(collection, "code", ["a", "b"], "desc", 30,
+                              "11/21/2017 - 11/27/2017")
+    meeting_store.add_response(collection, "code", "a", busy_for(0, 3))
+    assert meeting_store.exists(collection, "code")
+    assert not meeting_store.exists(collection, "nope")
+    for route, fields in meeting_store.ROUTE_FIELDS.items():
+        assert sorted(meeting_store.read(collection, "code", route)) == sorted(fields)
+    assert meeting_store.read(collection, "code", "populate") == \
+        {"description": "desc", "duration": 30, "participants": ["b"]}
+    assert meeting_store.version(collection, "code") == 2
+
+
+def test_order_says_nothing_about_who():
+    """
+    The busy log and the list of who has responded are both kept sorted,
+    so the nth busy log entry isn't the nth person to respond.
+    """
+    record = meeting_store.new_meeting("code")
+    record["participants"] = ["alice", "bob", "carol"]
+    collection = make_collection(record)
+    # Busy times that sort in the opposite order to the names.
+    for person, name in [(0, "carol"), (2, "alice"), (1, "bob")]:
+        meeting_store.add_response(collection, "code", name, busy_for(person, 2))
+    record = collection.find_one({"code": "code"})
+    assert record["already_checked_in"] == ["alice", "bob", "carol"]
+    assert record["busy_log"] == sorted(record["busy_log"])
+    # Pending busy times are sorted by start, everyone's mixed together.
+    starts = [i["start"] for i in record["pending"]]
+    assert len(starts) == 6 and starts == sorted(starts)
+    everyone = busy_index.build(busy_for(0, 2) + busy_for(1, 2) + busy_for(2, 2))
+    assert meeting_store.current_index(collection, "code") == everyone
+    record = collection.find_one({"code": "code"})
+    assert record["merged_count"] == record["log_count"] == 3
+    assert record["pending"] == []
+    assert busy_codec.unpack(record["merged"]) == everyone
+
+
+def test_response_sends_only_new_busy():
+    """
+    Saving a response reads nothing but whether the meeting needs
+    migrating, and sends only the new busy times.
+    """
+    record = meeting_store.new_meeting("code")
+    record["participants"] = ["p{}".format(i) for i in range(6)]
+    collection = make_collection(record)
+    for i in range(5):
+        meeting_store.add_response(collection, "code", "p{}".format(i), busy_for(i, 10))
+    reads, updates = [], []
+    find_one, update_one = collection.find_one, collection.update_one
+    collection.find_one = lambda *args, **kwargs: reads.append(args) or find_one(*args, **kwargs)
+    collection.update_one = lambda *args, **kwargs: updates.append(args) or \
+        update_one(*args, **kwargs)
+    meeting_store.add_response(collection, "code", "p5", busy_for(5, 2))
+    assert len(reads) == 1 and "log_count" in reads[0][1] and "merged" not in reads[0][1]
+    assert [len(i[1]['$push']["pending"]["$each"]) for i in updates] == [2]
+    assert "merged" not in str(updates)
+
+
+def test_fold_keeps_later_responses():
+    """
+    A response sent while current_index is folding in pending isn't
+    lost: the folded index isn't saved, and it's folded in next time.
+    """
+    collection = make_collection(meeting_store.new_meeting("code"))
+    meeting_store.add_response(collection, "code", "a", busy_for(0, 2))
+    find_one = collection.find_one
+
+    def respond_after_read(*args, **kwargs):
+        record = find_one(*args, **kwargs)
+        if "pending" in (args[1] if len(args) > 1 else {}):
+            collection.find_one = find_one
+            meeting_store.add_response(collection, "code", "b", busy_for(1, 2))
+        return record
+
+    collection.find_one = respond_after_read
+    assert meeting_store.current_index(collection, "code") == busy_index.build(busy_for(0, 2))
+    record = collection.find_one({"code": "code"})
+    assert record["merged_count"] == 0
+    assert len(record["pending"]) == 4
+    assert meeting_store.current_index(collection, "code") == \
+        busy_index.build(busy_for(0, 2) + busy_for(1, 2))
+    assert collection.find_one({"code": "code"})["pending"] == []
+
+
+def test_only_participants_check_in():
+    """
+    Someone who isn't on the list of participants, or who responds
+    again, has their busy times counted, but isn't added to the people
+    who have responded, or given another entry in the busy log.
+    """
+    record = meeting_store.new_meeting("code")
+    record["participants"] = ["alice"]
+    collection = make_collection(record)
+    meeting_store.add_response(collection, "code", "mallory", busy_for(0, 2))
+    meeting_store.add_response(collection, "code", "alice", busy_for(1, 2))
+    meeting_store.add_response(collection, "code", "alice", busy_for(2, 2))
+    record = collection.find_one({"code": "code"})
+    assert record["participants"] == []
+    assert record["already_checked_in"] == ["alice"]
+    assert record["log_count"] == 1
+    assert meeting_store.responses(collection, "code") == [busy_index.build(busy_for(1, 2))]
+    assert meeting_store.current_index(collection, "code") == \
+        busy_index.build(busy_for(0, 2) + busy_for(1, 2) + busy_for(2, 2))
+    assert collection.find_one({"code": "code"})["merged_count"] == 3
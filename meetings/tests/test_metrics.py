@@ -0,0 +1,71 @@
+# Nose tests for the counters and timers served at /metrics.
+# Author Sam Champer
+
+import metrics
+
+
+def test_counter():
+    registry = metrics.Registry()
+    registry.inc("meetme_responses_total", (("route", "/"), ("status", "200")))
+    registry.inc("meetme_responses_total", (("route", "/"), ("status", "200")))
+    registry.inc("meetme_responses_total", (("route", "/"), ("status", "404")))
+    text = registry.render()
+    assert 'meetme_responses_total{route="/",status="200"} 2\n' in text
+    assert 'meetme_responses_total{route="/",status="404"} 1\n' in text
+    assert "# TYPE meetme_responses_total counter\n" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    labels = (("command", "find"),)
+    for value in [0.0001, 0.003, 0.003, 100]:
+        registry.observe("meetme_mongo_seconds", labels, value)
+    lines = registry.render().splitlines()
+    assert 'meetme_mongo_seconds_bucket{command="find",le="0.0005"} 1' in lines
+    assert 'meetme_mongo_seconds_bucket{command="find",le="0.0025"} 1' in lines
+    assert 'meetme_mongo_seconds_bucket{command="find",le="0.005"} 3' in lines
+    assert 'meetme_mongo_seconds_bucket{command="find",le="30"} 3' in lines
+    assert 'meetme_mongo_seconds_bucket{command="find",le="+Inf"} 4' in lines
+    assert 'meetme_mongo_seconds_count{command="find"} 4' in lines
+    total = [i for i in lines if i.startswith("meetme_mongo_seconds_sum")][0]
+    assert abs(float(total.split()[-1]) - 100.0061) < 1e-9
+
+
+def test_bucket_bounds_are_inclusive():
+    # A value equal to a bucket's bound goes in that bucket.
+    registry = metrics.Registry()
+    registry.observe("meetme_request_seconds", (("route", "/"),), 0.01)
+    assert 'meetme_request_seconds_bucket{route="/",le="0.005"} 0' in registry.render()
+    assert 'meetme_request_seconds_bucket{route="/",le="0.01"} 1' in registry.render()
+
+
+def test_label_escaping():
+    assert metrics.label_text(()) == ""
+    assert metrics.label_text((("a", 'say "hi"\\\n'),)) == '{a="say \\"hi\\"\\\\\\n"}'
+
+
+def test_timer_counts_errors():
+    before = metrics.REGISTRY.counters.get(
+        ("meetme_gcal_errors_total", (("call", "test.fail"),)), 0)
+    try:
+        with metrics.gcal_call("test.fail"):
+            raise RuntimeError("nope")
+    except RuntimeError:
+        pass
+    with metrics.gcal_call("test.fail"):
+        pass
+    key = ("meetme_gcal_errors_total", (("call", "test.fail"),))
+    assert metrics.REGISTRY.counters[key] == before + 1
+    histogram = metrics.REGISTRY.histograms[("meetme_gcal_call_seconds", (("call", "test.fail"),))]
+    assert sum(histogram[:-1]) >= 2
+
+
+def test_free_stages_are_timed():
+    import arrow
+    from epoch_free import DayRange, db_free
+    begin = arrow.get("2017-11-20T00:00:00-08:00")
+    db_free([["2017-11-20T09:00:00-08:00", "2017-11-20T10:00:00-08:00"]],
+            DayRange(begin, begin.shift(days=1)), 30)
+    stages = {dict(labels)["stage"] for name, labels in metrics.REGISTRY.histograms
+              if name == "meetme_free_stage_seconds" and dict(labels)["func"] == "db_free"}
+    assert stages == {"parse", "sort", "merge", "gaps", "crop"}
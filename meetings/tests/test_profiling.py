@@ -0,0 +1,93 @@
+# Nose tests for opt in profiling of requests.
+# Author Sam Champer
+
+import os
+import pstats
+import sys
+import tempfile
+
+import flask
+
+import profiling
+
+
+def make_app(directory, rate=0):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+
+    @app.route("/_pull_info")
+    def pull_info():
+        flask.session["meetcode"] = "aBc/../De"
+        return "hi"
+
+    @app.route("/_broken")
+    def broken():
+        raise RuntimeError("broken")
+
+    return app, profiling.install(app, directory, "secret", rate)
+
+
+def test_tokens():
+    token = profiling.make_token("secret", 60, now=1000)
+    assert profiling.valid_token("secret", token, now=1059)
+    # Run out, signed with another key, or tampered with.
+    assert not profiling.valid_token("secret", token, now=1061)
+    assert not profiling.valid_token("other", token, now=1000)
+    assert not profiling.valid_token("secret", "9" + token, now=1000)
+    assert not profiling.valid_token("secret", "junk", now=1000)
+
+
+def test_file_name():
+    name = profiling.file_name("/_pull_info", "aBc/../De", now=1511256600.5)
+    assert name == "20171121-093000.500000_pull_info_aBc_De.pstats"
+    assert profiling.file_name("/", None, now=0).endswith("_request.pstats")
+
+
+def test_off_without_directory():
+    app, installed = make_app("")
+    assert not installed
+    assert not app.before_request_funcs.get(None)
+
+
+def test_profiles_requests_with_token():
+    with tempfile.TemporaryDirectory() as directory:
+        app, installed = make_app(directory)
+        assert installed
+        client = app.test_client()
+        assert client.get("/_pull_info").data == b"hi"
+        assert client.get("/_pull_info", headers={"X-Profile": "bad"}).data == b"hi"
+        assert os.listdir(directory) == []
+
+        token = profiling.make_token("secret")
+        client.get("/_pull_info", headers={"X-Profile": token})
+        client.get("/_pull_info", query_string={"profile": token})
+        saved = sorted(os.listdir(directory))
+        assert len(saved) == 2
+        assert all(i.endswith("_pull_info_aBc_De.pstats") for i in saved)
+        stats = pstats.Stats(os.path.join(directory, saved[0]))
+        assert any(i[2] == "pull_info" for i in stats.stats)
+
+
+def test_sampling():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = make_app(directory, rate="1.0")
+        app.test_client().get("/_pull_info")
+        assert len(os.listdir(directory)) == 1
+
+
+def test_profile_saved_when_request_fails():
+    """
+    A request that raises, with the error let through to the server as
+    in debug mode, still gets its profile saved and the profiler off.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = make_app(directory, rate=1)
+        app.config["PROPAGATE_EXCEPTIONS"] = True
+        try:
+            app.test_client().get("/_broken")
+            assert False, "the error wasn't let through"
+        except RuntimeError:
+            pass
+        assert sys.getprofile() is None
+        saved = os.listdir(directory)
+        assert len(saved) == 1 and saved[0].endswith("_broken.pstats")
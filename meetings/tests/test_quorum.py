@@ -0,0 +1,120 @@
+# Nose tests for free times that suit at least k of a group.
+# Author Sam Champer
+
+import random
+
+import arrow
+
+import epoch_free
+import quorum
+
+day_range = list(arrow.Arrow.range('day',
+                                   arrow.get("2017-11-21T00:00:00-08:00"),
+                                   arrow.get("2017-11-27T00:00:00-08:00")))
+range_open = int(day_range[0].timestamp())
+
+
+def random_responses(count, seed, per_person=15, days=day_range):
+    """
+    Busy times for a number of people, on the five minute grid, as they
+    are saved: each person's events merged with the closed hours from
+    5pm to 9am, which run past the start of the last day.
+    """
+    rng = random.Random(seed)
+    start_of_range = int(days[0].timestamp())
+    responses = []
+    for _ in range(count):
+        busy = list(epoch_free.closed_hours(9, 0, 17, 0, days))
+        for _ in range(per_person):
+            start = start_of_range + rng.randrange(0, len(days) * 24 * 12) * 300
+            busy.append((start, start + rng.randrange(1, 60) * 300, None, None))
+        responses.append([[i[0], i[1]] for i in epoch_free.merge_intervals(sorted(busy))])
+    return responses
+
+
+def test_to_bits():
+    """
+    Any part of a slot being busy makes it busy, and
+    times outside of the range are left out.
+    """
+    assert quorum.to_bits([[0, 300]], 0, 10) == 0b1
+    assert quorum.to_bits([[1, 301]], 0, 10) == 0b11
+    assert quorum.to_bits([[-600, 600], [2700, 9000]], 0, 10) == 0b1000000011
+    assert quorum.to_bits([[-600, -300], [3000, 3600]], 0, 10) == 0
+
+
+def test_counts():
+    """
+    The bit sliced counters agree with counting slot by slot.
+    """
+    rng = random.Random(1)
+    slots = 200
+    full = (1 << slots) - 1
+    bitsets = [rng.getrandbits(slots) for _ in range(13)]
+    counters = []
+    for bits in bitsets:
+        quorum.add_bits(counters, bits)
+    counts = [sum((bits >> i) & 1 for bits in bitsets) for i in range(slots)]
+    for limit in range(-1, 15):
+        mask = quorum.at_most(counters, limit, full)
+        assert [(mask >> i) & 1 for i in range(slots)] == [int(c <= limit) for c in counts]
+
+
+def test_runs():
+    """
+    Runs of set bits come out in order.
+    """
+    assert list(quorum.runs(0)) == []
+    assert list(quorum.runs(0b1)) == [(0, 1)]
+    assert list(quorum.runs(0b1110011000)) == [(3, 5), (7, 10)]
+    assert list(quorum.runs(((1 << 100) - 1) << 50)) == [(50, 150)]
+
+
+def test_everyone_free():
+    """
+    With k of k, quorum times are the usual free times.
+    """
+    for seed in range(5):
+        responses = random_responses(6, seed)
+        index = []
+        for busy in responses:
+            for start, end in busy:
+                index.append((start, end, None, None))
+        index = [[i[0], i[1]] for i in epoch_free.merge_intervals(sorted(index))]
+        expected = epoch_free.index_free(index, day_range, 30)
+        found = quorum.quorum_free(responses, day_range, 30, len(responses))
+        assert found == expected
+
+
+def test_fewer_needed():
+    """
+    Needing fewer people free only ever adds free time,
+    and needing nobody makes the whole range free.
+    """
+    responses = random_responses(5, 7)
+
+    def free_slots(k):
+        found = quorum.quorum_free(responses, day_range, 0, k)
+        return sum((int(end.timestamp()) - int(start.timestamp())) // quorum.QUANTUM
+                   for start, end in found)
+
+    totals = [free_slots(k) for k in range(5, -1, -1)]
+    assert totals == sorted(totals)
+    # With nobody needed, everything from the start of the range to
+    # the end of the last closed hours is free.
+    last_end = max(i[-1][1] for i in responses)
+    assert totals[-1] == (last_end - range_open) // quorum.QUANTUM
+
+
+def test_last_day():
+    """
+    The last day of the range has free times, as it does on the status page.
+    """
+    days = list(arrow.Arrow.range('day', arrow.get("2017-11-21T00:00:00-08:00"),
+                                  arrow.get("2017-11-23T00:00:00-08:00")))
+    responses = random_responses(3, 2, per_person=0, days=days)
+    found = quorum.quorum_free(responses, days, 30, 3)
+    assert [[i.isoformat() for i in window] for window in found] == \
+        [["2017-11-{}T09:00:00-08:00".format(d), "2017-11-{}T17:00:00-08:00".format(d)]
+         for d in (21, 22, 23)]
+    assert found == epoch_free.index_free(responses[0], days, 30)
@@ -0,0 +1,75 @@
+# Nose tests for the LRU result cache.
+# Author Sam Champer
+
+import threading
+import time
+
+from result_cache import LRUCache
+
+
+def test_get_and_put():
+    """
+    Cached items come back out, missing ones give the default.
+    """
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("b", 5) == 5
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_eviction():
+    """
+    The least recently used item is the one that gets evicted.
+    """
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_ttl():
+    """
+    Items expire ttl seconds after they are added.
+    """
+    now = [100.0]
+    cache = LRUCache(max_size=2, ttl=10)
+    cache.clock = lambda: now[0]
+    cache.put("a", 1)
+    now[0] = 109.0
+    assert cache.get("a") == 1
+    now[0] = 110.0
+    assert cache.get("a") is None
+    assert "a" not in cache
+
+
+def test_made_once():
+    """
+    Threads asking for the same missing item at once make it only once,
+    and all get it. Different keys are made separately.
+    """
+    cache = LRUCache(max_size=4)
+    made = []
+
+    def make():
+        made.append(1)
+        time.sleep(0.1)
+        return {"made": len(made)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_make("a", make)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(made) == 1
+    assert results == [{"made": 1}] * 8
+    assert cache.get_or_make("b", make) == {"made": 2}
+    assert cache.making == {}
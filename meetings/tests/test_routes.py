@@ -0,0 +1,233 @@
+# Nose tests that call each route of the app, against an in-memory stand
+# in for Mongo and the fake Google calendar, with the same setup as the
+# load test (tests/bench_load.py).
+# Author Sam Champer
+
+import io
+import json
+
+from tests.bench_load import fake_credentials, load_app
+from tests.fake_gcal import FakeCalendar, make_calendars
+
+FAKE = FakeCalendar(make_calendars(2, 3, 7))
+flask_main = None
+
+DATERANGE = "11/21/2017 - 11/23/2017"
+HOURS = {"open": "9:00am", "close": "5:00pm"}
+
+
+def setup_module():
+    global flask_main
+    FAKE.__enter__()
+    flask_main = load_app(FAKE.url)
+
+
+def teardown_module():
+    FAKE.__exit__(None, None, None)
+
+
+def browser():
+    """
+    A test client whose session holds OAuth credentials.
+    """
+    client = flask_main.app.test_client()
+    with client.session_transaction() as session:
+        session["credentials"] = fake_credentials()
+    return client
+
+
+def new_meeting(people=("al", "bob"), duration=60):
+    """
+    Set up a meeting.
+    :return: a client whose session is on the new meeting, and its code.
+    """
+    client = browser()
+    assert client.get("/new_meeting").status_code == 200
+    answer = client.get("/_get_names", query_string={
+        "participants": json.dumps(list(people), separators=(",", ":")),
+        "desc": "Test", "duration": str(duration), "daterange": DATERANGE})
+    return client, answer.get_json()["result"]["meetcode"]
+
+
+def send(client, invitee, busy):
+    busy = json.dumps(busy, separators=(",", ":"))
+    assert client.get("/_send", query_string={"invitee": invitee, "busy_times": busy}) \
+        .status_code == 200
+
+
+BUSY = [["2017-11-21T10:00:00-08:00", "2017-11-21T11:00:00-08:00"]]
+
+
+def test_pages():
+    client, meetcode = new_meeting()
+    assert client.get("/").status_code == 200
+    assert client.get("/_check", query_string={"meet_code": meetcode}).get_json() == \
+        {"result": {}}
+    assert client.get("/_check", query_string={"meet_code": "nope"}).get_json() == \
+        {"result": {"error": "1"}}
+    assert client.get("/{}/join".format(meetcode)).status_code == 200
+    assert client.get("/_populate").get_json()["result"]["participants"] == ["al", "bob"]
+    assert client.get("/{}/status".format(meetcode)).status_code == 200
+    assert client.get("/healthz").get_json() == {"status": "ok"}
+    assert b"meetme_request_seconds" in client.get("/metrics").data
+
+
+def test_pull_info_etag():
+    """
+    Asking again with the ETag gets a 304 until the meeting changes.
+    """
+    client, meetcode = new_meeting()
+    first = client.get("/_pull_info")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    again = client.get("/_pull_info", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+    send(client, "al", BUSY)
+    changed = client.get("/_pull_info", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["result"] != first.get_json()["result"]
+
+
+def test_events_and_stream():
+    """
+    The streamed events have a line per calendar, then the same
+    result as /_events, each line a JSON document.
+    """
+    client, _ = new_meeting()
+    calendars = client.get("/_choose").get_json()["result"]["cal_list"]
+    chosen = json.dumps([i["summary"] for i in calendars])
+    query = dict(HOURS, chosen=chosen)
+    result = client.get("/_events", query_string=query).get_json()["result"]
+    assert result["event_list"] and result["formatted_free_times"]
+
+    stream = client.get("/_events_stream", query_string=query)
+    assert stream.mimetype == "application/x-ndjson"
+    text = stream.get_data(as_text=True)
+    assert text.endswith("\n")
+    lines = [json.loads(i) for i in text.split("\n")[:-1]]
+    assert sorted(i["calendar"] for i in lines[:-1]) == sorted(i["summary"] for i in calendars)
+    assert lines[-1] == {"result": result}
+
+
+def test_status_stream():
+    """
+    Events carry the meeting version as their id, and a browser that
+    already has the latest version isn't sent it again.
+    """
+    client, meetcode = new_meeting()
+    send(client, "al", BUSY)
+    version = flask_main.meeting_store.version(flask_main.collection, meetcode)
+    stream_max = flask_main.CONFIG.STATUS_STREAM_MAX
+    flask_main.CONFIG.STATUS_STREAM_MAX = 0.1
+    try:
+        text = client.get("/_status_stream").get_data(as_text=True)
+        events = text.split("\n\n")
+        assert events[0] == "retry: 1000"
+        assert events[1].startswith("id: {}\ndata: ".format(version))
+        data = json.loads(events[1].split("data: ", 1)[1])
+        assert data == client.get("/_pull_info").get_json()["result"]
+
+        text = client.get("/_status_stream", headers={"Last-Event-ID": str(version)}) \
+            .get_data(as_text=True)
+        assert "id: " not in text
+
+        # Set to 0, for servers with one thread per worker, each
+        # connection is one check, and the browser comes back later.
+        flask_main.CONFIG.STATUS_STREAM_MAX = 0
+        text = client.get("/_status_stream").get_data(as_text=True)
+        assert text == "retry: {}\n\nid: {}\ndata: {}\n\n".format(
+            flask_main.CONFIG.STATUS_POLL * 1000, version, events[1].split("data: ", 1)[1])
+        text = client.get("/_status_stream", headers={"Last-Event-ID": str(version)}) \
+            .get_data(as_text=True)
+        assert text == "retry: {}\n\n".format(flask_main.CONFIG.STATUS_POLL * 1000)
+    finally:
+        flask_main.CONFIG.STATUS_STREAM_MAX = stream_max
+
+
+def test_best_times():
+    client, _ = new_meeting()
+    send(client, "al", BUSY)
+    best = client.get("/_best_times", query_string={"k": 2, "prefer": "midday"}).get_json()
+    assert len(best["result"]["best_times"]) == 2
+    for query, error in [({"k": "x"}, "k should be a number"),
+                         ({"prefer": "bogus"}, "unknown preference: bogus")]:
+        answer = client.get("/_best_times", query_string=query)
+        assert answer.status_code == 400
+        assert answer.get_json() == {"result": {"error": error}}
+
+
+def test_quorum_free():
+    client, _ = new_meeting()
+    send(client, "al", BUSY)
+    send(client, "bob", [["2017-11-21T00:00:00-08:00", "2017-11-24T00:00:00-08:00"]])
+    answer = client.get("/_quorum_free").get_json()["result"]
+    assert answer["k"] == 1 and answer["responded"] == 2
+    assert answer["free"]
+    # Responding again doesn't make someone count twice.
+    send(client, "al", BUSY)
+    send(client, "al", BUSY)
+    assert client.get("/_quorum_free").get_json()["result"]["responded"] == 2
+    answer = client.get("/_quorum_free", query_string={"k": "z"})
+    assert answer.status_code == 400
+    assert answer.get_json() == {"result": {"error": "k should be a number"}}
+
+
+def test_heatmap():
+    client, _ = new_meeting()
+    send(client, "al", BUSY)
+    answer = client.get("/_heatmap").get_json()["result"]
+    assert answer["bucket_minutes"] == 60
+    assert answer["responded"] == 1
+    assert sum(answer["counts"]) == 1
+    # A row of 24 hours for each of the 3 days, the last day included.
+    assert len(answer["counts"]) == 3 * 24
+    assert len(client.get("/_heatmap", query_string={"minutes": 30})
+               .get_json()["result"]["counts"]) == 3 * 48
+    for query, error in [({"minutes": "q"}, "minutes should be a number")]:
+        answer = client.get("/_heatmap", query_string=query)
+        assert answer.status_code == 400
+        assert answer.get_json() == {"result": {"error": error}}
+
+
+def test_worked_out_once_per_version():
+    """
+    Every status page asks for the heatmap and quorum free times each
+    time the meeting changes, so they're only worked out once a version.
+    """
+    client, _ = new_meeting()
+    send(client, "al", BUSY)
+    made = []
+    real = {name: getattr(flask_main, name) for name in ("heatmap_result", "quorum_result")}
+    for name, func in real.items():
+        setattr(flask_main, name,
+                lambda *args, name=name, func=func: made.append(name) or func(*args))
+    try:
+        for _ in range(3):
+            client.get("/_heatmap")
+            client.get("/_quorum_free")
+        assert sorted(made) == ["heatmap_result", "quorum_result"]
+        client.get("/_heatmap", query_string={"minutes": 30})
+        send(client, "bob", BUSY)
+        client.get("/_heatmap")
+        client.get("/_quorum_free")
+        assert len(made) == 5
+    finally:
+        for name, func in real.items():
+            setattr(flask_main, name, func)
+
+
+def test_upload_ics():
+    client, _ = new_meeting()
+    ics = ("BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nSUMMARY:Dentist\r\n"
+           "DTSTART:20171121T100000Z\r\nDTEND:20171121T110000Z\r\n"
+           "END:VEVENT\r\nEND:VCALENDAR\r\n")
+    answer = client.post("/_upload_ics", data=dict(
+        HOURS, calendar=(io.BytesIO(ics.encode()), "cal.ics")))
+    assert answer.status_code == 200
+    result = answer.get_json()["result"]
+    assert [i for i in result["event_list"] if "Dentist" in str(i)]
+    answer = client.post("/_upload_ics", data=HOURS)
+    assert answer.status_code == 400
+    assert answer.get_json() == {"result": {"error": "no calendar file"}}
@@ -0,0 +1,198 @@
+# Nose tests for how fast flask_main imports, and what it needs to start.
+# Author Sam Champer
+#
+# flask_main is imported in a fresh interpreter each time, so that
+# modules other tests have already imported don't hide anything.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import mongomock
+import pymongo
+from pymongo.errors import PyMongoError
+
+from mongo_connection import LazyCollection
+
+MEETINGS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds importing flask_main may take. It takes about 0.3s on a slow
+# machine, of which flask is half. Importing pymongo, oauth2client and
+# the Google client as well takes it to about 0.7s.
+IMPORT_BUDGET = 0.5
+
+# Only the calendar routes need these, and only the first
+# database call needs pymongo, so none should be imported at start.
+LAZY_MODULES = ["pymongo", "oauth2client", "httplib2", "googleapiclient", "apiclient"]
+
+# The database can't be reached, and isn't waited on for long.
+CREDENTIALS_INI = """[DEFAULT]
+DEBUG = False
+SECRET_KEY = test
+GOOGLE_KEY_FILE = client_secret.json
+DB_USER = u
+DB_USER_PW = p
+DB_HOST = 127.0.0.1
+DB_PORT = 1
+DB = meetings
+MONGO_RETRIES = 1
+MONGO_TIMEOUT = 1
+"""
+
+
+def run_python(code, importtime=False):
+    """
+    Run code in a fresh interpreter, next to a credentials.ini.
+    :return: (stdout, stderr)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "credentials.ini"), "w") as ini:
+            ini.write(CREDENTIALS_INI)
+        env = dict(os.environ, PYTHONPATH=MEETINGS)
+        command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+        done = subprocess.run(command, cwd=directory, env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+    assert done.returncode == 0, done.stderr
+    return done.stdout, done.stderr
+
+
+def import_seconds():
+    """
+    Time taken to import flask_main, as -X importtime reports it.
+    """
+    _, err = run_python("import flask_main", importtime=True)
+    for line in err.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and parts[-1].strip() == "flask_main":
+            return int(parts[1]) / 1e6
+    raise AssertionError("no import time for flask_main in:\n" + err)
+
+
+def test_import_budget():
+    # Best of three, so one slow run on a busy machine doesn't fail it.
+    seconds = min(import_seconds() for _ in range(3))
+    assert seconds < IMPORT_BUDGET, "importing flask_main took {:.3f}s".format(seconds)
+
+
+def test_lazy_imports():
+    out, _ = run_python("import sys, json, flask_main\n"
+                        "print(json.dumps(sorted(sys.modules)))")
+    loaded = {i.split(".")[0] for i in json.loads(out.splitlines()[-1])}
+    assert not loaded & set(LAZY_MODULES), loaded & set(LAZY_MODULES)
+
+
+def test_starts_without_database():
+    """
+    With no database, the app still starts, pages that don't need it
+    work, and the health check says it isn't ready.
+    """
+    out, _ = run_python("import json, flask_main\n"
+                        "client = flask_main.app.test_client()\n"
+                        "health = client.get('/healthz')\n"
+                        "print(json.dumps([client.get('/').status_code,\n"
+                        "                  health.status_code, health.get_json()['status']]))")
+    assert json.loads(out.splitlines()[-1]) == [200, 503, "unavailable"]
+
+
+def test_lazy_collection_retries():
+    """
+    Connecting is tried retries times, backing off, then the error is
+    raised, and the next use tries again.
+    """
+    collection = LazyCollection("mongodb://127.0.0.1:1/meetings", "meetings",
+                                retries=2, timeout=0.05, backoff=0.2)
+    start = time.monotonic()
+    try:
+        collection.find_one({"code": "abc"})
+        assert False, "connected to nothing"
+    except PyMongoError:
+        pass
+    assert time.monotonic() - start >= 0.2
+    assert collection.collection is None
+
+
+def test_lazy_collection_fails_fast():
+    """
+    Requests that wait while connecting fails get the same error straight
+    away, rather than each going through every try again in turn. So do
+    requests soon after, until retry_after has gone by.
+    """
+    def unreachable():
+        return LazyCollection("mongodb://127.0.0.1:1/meetings", "meetings",
+                              retries=2, timeout=0.2, backoff=0.2, retry_after=30)
+    errors = []
+
+    def use(collection):
+        start = time.monotonic()
+        try:
+            collection.find_one({"code": "abc"})
+        except PyMongoError as error:
+            errors.append(error)
+        return time.monotonic() - start
+
+    # How long one request takes to go through every try.
+    one_round = use(unreachable())
+
+    collection = unreachable()
+    threads = [threading.Thread(target=use, args=(collection,)) for _ in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 5
+    # Each going through every try in turn would take four rounds.
+    took = time.monotonic() - start
+    assert took < 2 * one_round, (took, one_round)
+
+    assert use(collection) < 0.1
+    assert len(errors) == 6
+
+
+def test_ping_skips_connecting():
+    """
+    A health check pings once, without waiting on requests that
+    are connecting.
+    """
+    collection = LazyCollection("mongodb://127.0.0.1:1/meetings", "meetings",
+                                retries=5, timeout=5)
+    errors = []
+
+    def ping():
+        try:
+            collection.ping(timeout=0.2)
+        except PyMongoError as error:
+            errors.append(error)
+
+    # As if another request were in the middle of connecting.
+    with collection.lock:
+        start = time.monotonic()
+        thread = threading.Thread(target=ping)
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+    assert len(errors) == 1
+    assert time.monotonic() - start < 1
+    assert collection.collection is None
+
+
+def test_lazy_collection_connects_once():
+    real_client = pymongo.MongoClient
+    pymongo.MongoClient = mongomock.MongoClient
+    try:
+        collection = LazyCollection("mongodb://127.0.0.1/meetings", "meetings")
+        assert collection.collection is None
+        collection.insert_one({"code": "abc"})
+        connected = collection.collection
+        assert collection.find_one({"code": "abc"}, {"_id": 0}) == {"code": "abc"}
+        assert collection.collection is connected
+        # The unique index on code is made when connecting.
+        assert any(i.get("unique") for i in collection.index_information().values())
+        # Once connected, the health check pings the same client.
+        collection.ping()
+    finally:
+        pymongo.MongoClient = real_client
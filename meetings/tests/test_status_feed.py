@@ -0,0 +1,79 @@
+# Nose tests for pushing meeting changes to status pages.
+# Author Sam Champer
+
+import threading
+
+from status_feed import StatusFeed
+
+
+def test_wait_times_out():
+    """
+    With no changes, waiting gives up after the timeout.
+    """
+    feed = StatusFeed()
+    with feed.watch("abc") as watch:
+        assert not watch.wait(0.01)
+
+
+def test_publish_wakes_watcher():
+    """
+    A change published while a watcher is waiting wakes it up,
+    and a change published between waits isn't missed.
+    """
+    feed = StatusFeed()
+    with feed.watch("abc") as watch:
+        timer = threading.Timer(0.05, feed.publish, ["abc"])
+        timer.start()
+        assert watch.wait(5)
+        timer.join()
+        feed.publish("abc")
+        assert watch.wait(0)
+        assert not watch.wait(0)
+
+
+def test_only_that_meeting():
+    """
+    Watchers of other meetings don't hear about a change.
+    """
+    feed = StatusFeed()
+    with feed.watch("abc") as abc, feed.watch("xyz") as xyz:
+        feed.publish("abc")
+        assert abc.wait(0)
+        assert not xyz.wait(0)
+
+
+def test_many_watchers():
+    """
+    One publish wakes every watcher of a meeting, and the meeting
+    is forgotten once they all stop watching.
+    """
+    feed = StatusFeed()
+    count = 200
+    ready = threading.Barrier(count + 1)
+    woken = []
+
+    def watcher():
+        with feed.watch("abc") as watch:
+            ready.wait()
+            woken.append(watch.wait(5))
+
+    threads = [threading.Thread(target=watcher) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    assert feed.watchers("abc") == count
+    feed.publish("abc")
+    for thread in threads:
+        thread.join()
+    assert woken == [True] * count
+    assert feed.watchers("abc") == 0
+    assert feed.meetings == {}
+
+
+def test_publish_without_watchers():
+    """
+    Publishing to a meeting nobody is watching does nothing.
+    """
+    feed = StatusFeed()
+    feed.publish("abc")
+    assert feed.meetings == {}